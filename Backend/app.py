@@ -1,15 +1,46 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify, send_from_directory, g, Response
+from flask.cli import ScriptInfo
 from flask_cors import CORS
-import mysql.connector
 from dotenv import load_dotenv
+import functools
+import json
+import logging
 import os
-from werkzeug.utils import secure_filename
+import secrets
+import sys
+import time
+import urllib.request
+from werkzeug.middleware.proxy_fix import ProxyFix
+from db_pool import PoolExhausted
+from storage import create_repository, DuplicateEmail, UserHasVoted
+from vote_ingest import VoteIngestor, IngestQueueFull, InvalidBallot, normalize_ballot
+from vote_log import VoteLog, InvalidLog
+from ballot_index import BallotIndex
+from results_stream import ResultsBroadcaster
+from user_bulk import detect_format, iter_records, import_users, export_users
+from listing import BadListingRequest, parse_page_args, parse_fields
+from observability import setup_logging, registry, instrument_cursor, current_request, RequestStats, COUNT_BUCKETS
+from credentials import PasswordHasher, HasherBusy, SCRYPT_N, is_hashed
+from sessions import SessionSigner, InvalidToken, bearer_token
+from user_cache import UserCache
+from rate_limit import AdmissionControl, LocalBucketStore, SQLiteBucketStore, Throttled
+from images import ImagePipeline, InvalidImage, MAX_IMAGE_BYTES, image_digest, is_content_addressed, remove_image_files
+import click
 
 load_dotenv()
 
+setup_logging(os.getenv('LOG_LEVEL', 'INFO'))
+logger = logging.getLogger('voting')
+
 app = Flask(__name__)
 CORS(app)
 
+# Behind a reverse proxy every request comes from the proxy's address; set this to the
+# number of trusted proxies so per-IP rate limits see the real client from X-Forwarded-For
+PROXY_FIX_X_FOR = int(os.getenv('PROXY_FIX_X_FOR', 0))
+if PROXY_FIX_X_FOR:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_FIX_X_FOR)
+
 # MySQL config (load from .env)
 DB_CONFIG = {
     'host': os.getenv('DB_HOST', 'localhost'),
@@ -18,6 +49,12 @@ DB_CONFIG = {
     'password': os.getenv('DB_PASSWORD', ''),
 }
 DB_NAME = os.getenv('DB_NAME', 'sql7789376') 
+# gunicorn's gevent worker patches the stdlib before importing the app. mysql-connector's C
+# extension does its own blocking socket I/O that gevent cannot patch, so one query would
+# freeze every greenlet in the worker; the pure-Python driver goes through patched sockets.
+gevent_monkey = sys.modules.get('gevent.monkey')
+if gevent_monkey is not None and gevent_monkey.is_module_patched('socket'):
+    DB_CONFIG['use_pure'] = True
 
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
@@ -29,221 +66,451 @@ if not os.path.exists(UPLOAD_FOLDER):
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    if not is_content_addressed(filename):
+        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    # Content-hash names never change, so browsers and CDNs may keep them for a year
+    response = send_from_directory(app.config['UPLOAD_FOLDER'], filename, max_age=IMMUTABLE_MAX_AGE,
+                                   etag=filename.rsplit('.', 1)[0])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
-def get_db():
-    return mysql.connector.connect(**DB_CONFIG)
+# Storage backend: mysql (default), sqlite (SQLITE_PATH) or memory (process-local, not persisted)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'mysql')
+if STORAGE_BACKEND == 'mysql':
+    # Shared connection pool; close() on a pooled connection returns it to the pool
+    repo = create_repository(
+        'mysql',
+        config=DB_CONFIG,
+        database=DB_NAME,
+        pool_size=int(os.getenv('DB_POOL_SIZE', 10)),
+        pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', 5)),
+        recycle=float(os.getenv('DB_POOL_RECYCLE', 1800)),
+        ping_interval=float(os.getenv('DB_POOL_PING_INTERVAL', 30)),
+        wrap_cursor=instrument_cursor,
+    )
+elif STORAGE_BACKEND == 'sqlite':
+    repo = create_repository(
+        'sqlite',
+        path=os.getenv('SQLITE_PATH', os.path.join(os.path.dirname(__file__), 'voting.db')),
+        pool_size=int(os.getenv('DB_POOL_SIZE', 10)),
+        pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', 5)),
+        wrap_cursor=instrument_cursor,
+    )
+else:
+    repo = create_repository(STORAGE_BACKEND)
 
-def get_db_with_database():
-    config_with_db = DB_CONFIG.copy()
-    config_with_db['database'] = DB_NAME
-    return mysql.connector.connect(**config_with_db)
+@app.errorhandler(PoolExhausted)
+@app.errorhandler(HasherBusy)
+def handle_server_busy(e):
+    response = jsonify({'success': False, 'message': 'Server is busy, please try again.'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
 
-def initialize_db():
-    print('--- initialize_db: Starting table initialization ---')
+# Passwords are stored as salted scrypt hashes and checked on a bounded worker pool;
+# plaintext rows from before hashing are upgraded on their next successful login
+password_hasher = PasswordHasher(
+    workers=int(os.getenv('PASSWORD_HASH_WORKERS', 0)) or None,
+    executor=os.getenv('PASSWORD_HASH_EXECUTOR', 'thread'),
+    max_pending=int(os.getenv('PASSWORD_HASH_MAX_PENDING', 0)) or None,
+    n=int(os.getenv('PASSWORD_SCRYPT_N', SCRYPT_N)),
+)
+user_cache = UserCache(
+    maxsize=int(os.getenv('USER_CACHE_SIZE', 10000)),
+    ttl=float(os.getenv('USER_CACHE_TTL', 30)),
+)
+
+def single_process_server():
+    # python app.py, python asgi.py and the flask CLI run one process; gunicorn and
+    # uvicorn --workers start several
+    main = os.path.basename(getattr(sys.modules['__main__'], '__file__', None) or '')
+    if main in ('app.py', 'asgi.py'):
+        return True
+    ctx = click.get_current_context(silent=True)
+    return ctx is not None and ctx.find_object(ScriptInfo) is not None
+
+# Login hands out a signed token that /api/vote checks instead of looking the user up.
+# Every worker must share SESSION_SECRET, or a token issued by one is rejected by the next.
+SESSION_SECRET = os.getenv('SESSION_SECRET')
+if not SESSION_SECRET:
+    if not single_process_server():
+        raise RuntimeError('SESSION_SECRET must be set when running under a multi-process server.')
+    logger.warning('SESSION_SECRET is not set; using a random per-process secret')
+    SESSION_SECRET = secrets.token_hex(32)
+session_signer = SessionSigner(SESSION_SECRET, ttl=int(os.getenv('SESSION_TTL', 3600)))
+VOTE_REQUIRE_TOKEN = os.getenv('VOTE_REQUIRE_TOKEN', '1') == '1'
+
+# Admission control for login and vote: a global in-flight limit below what the DB pool
+# can serve, plus token buckets per client IP, per login email and per voter. Rates are
+# tokens per second (0 disables); RATE_LIMIT_STORE=sqlite shares buckets between workers.
+RATE_LIMIT_STORE = os.getenv('RATE_LIMIT_STORE', 'local')
+if RATE_LIMIT_STORE == 'sqlite':
+    rate_limit_store = SQLiteBucketStore(
+        os.getenv('RATE_LIMIT_SQLITE_PATH', os.path.join(os.path.dirname(__file__), 'ratelimit.db')))
+else:
+    rate_limit_store = LocalBucketStore()
+# Without ProxyFix every client behind a reverse proxy shares the proxy's address and one
+# bucket, so the per-IP limit is off unless PROXY_FIX_X_FOR is set or it is asked for
+RATE_LIMIT_IP_RATE = float(os.getenv('RATE_LIMIT_IP_RATE', 20 if PROXY_FIX_X_FOR else 0))
+if RATE_LIMIT_IP_RATE and not PROXY_FIX_X_FOR:
+    logger.warning('RATE_LIMIT_IP_RATE is set without PROXY_FIX_X_FOR; behind a proxy all '
+                   'clients share one per-IP bucket')
+admission = AdmissionControl(
+    rate_limit_store,
+    max_concurrent=int(os.getenv('ADMISSION_MAX_CONCURRENT', 2 * int(os.getenv('DB_POOL_SIZE', 10)))),
+    limits={
+        'ip': (RATE_LIMIT_IP_RATE, int(os.getenv('RATE_LIMIT_IP_BURST', 100))),
+        'login': (float(os.getenv('RATE_LIMIT_LOGIN_RATE', 0.2)), int(os.getenv('RATE_LIMIT_LOGIN_BURST', 5))),
+        'vote': (float(os.getenv('RATE_LIMIT_VOTE_RATE', 0.1)), int(os.getenv('RATE_LIMIT_VOTE_BURST', 3))),
+    },
+)
+
+@app.errorhandler(Throttled)
+def handle_throttled(e):
+    response = jsonify({'success': False, 'message': str(e)})
+    response.status_code = e.status
+    response.headers['Retry-After'] = e.retry_after_header
+    return response
+
+def admitted(route):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with admission.admit(route, request.remote_addr):
+                return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@app.route('/api/admission', methods=['GET'])
+def admission_stats():
+    return jsonify(admission.stats())
+
+@app.errorhandler(InvalidToken)
+def handle_invalid_token(e):
+    return jsonify({'success': False, 'message': str(e)}), 401
+
+@app.route('/api/pool', methods=['GET'])
+def pool_stats():
+    return jsonify(repo.pool_stats() or {'backend': repo.name})
+
+# Request instrumentation: wall time, DB time and query count per route
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', 0))  # 0 disables the slow-request log
+request_seconds = registry.histogram('http_request_duration_seconds', 'Wall time per request.')
+request_db_seconds = registry.histogram('http_request_db_seconds', 'Time spent in SQL per request.')
+request_queries = registry.histogram('http_request_db_queries', 'SQL statements per request.', COUNT_BUCKETS)
+requests_total = registry.counter('http_requests_total', 'Requests by route, method and status.')
+requests_in_flight = registry.gauge('http_requests_in_flight', 'Requests currently being handled.')
+ballots_total = registry.counter('votes_ballots_total', 'Ballots accepted by /api/vote, by path.')
+
+@app.before_request
+def start_request_timer():
+    g.request_stats = RequestStats(keep_sql=SLOW_REQUEST_SECONDS > 0)
+    g.request_stats_token = current_request.set(g.request_stats)
+    requests_in_flight.inc()
+
+@app.after_request
+def record_request_timing(response):
+    stats = g.get('request_stats')
+    if stats is None:
+        return response
+    elapsed = time.perf_counter() - stats.started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    request_seconds.observe(elapsed, route=route, method=request.method)
+    request_db_seconds.observe(stats.db_time, route=route, method=request.method)
+    request_queries.observe(stats.queries, route=route, method=request.method)
+    requests_total.inc(route=route, method=request.method, status=response.status_code)
+    if SLOW_REQUEST_SECONDS and elapsed >= SLOW_REQUEST_SECONDS:
+        logger.warning('Slow request %s %s: %.1fms total, %.1fms in %d queries; sql=%s',
+                       request.method, route, elapsed * 1000, stats.db_time * 1000, stats.queries, stats.statements)
+    return response
+
+@app.teardown_request
+def finish_request_timer(exc):
+    if g.pop('request_stats', None) is not None:
+        current_request.reset(g.pop('request_stats_token'))
+        requests_in_flight.dec()
+
+# In-process ballot (positions/candidates) used to validate votes without lookup queries
+ballot_index = BallotIndex(
+    repo,
+    check_interval=float(os.getenv('BALLOT_VERSION_CHECK_INTERVAL', 1)),
+)
+
+# Audit trail: every ballot committed to storage is also appended to a hash-chained log
+# (VOTE_LOG=0 disables it) that `flask audit-votes` recounts and checks the votes table
+# against. The append runs after the commit, so the log never holds a vote storage refused.
+vote_log = None
+if os.getenv('VOTE_LOG', '1') == '1':
+    vote_log = VoteLog(
+        os.getenv('VOTE_LOG_PATH', os.path.join(os.path.dirname(__file__), 'votelog', 'votes.log')),
+        fsync=os.getenv('VOTE_LOG_FSYNC', '1') == '1',
+    )
+
+def append_vote_log(ballots):
+    # The ballots are already committed: failing the request would only invite the voter to
+    # retry. The gap is logged, counted, and reported by `flask audit-votes` as votes that
+    # are in the votes table but not in the log.
+    if vote_log is None:
+        return
     try:
-        # Connect directly to the specified existing database
-        db = get_db_with_database()
-        cursor = db.cursor()
-
-        schema = """
-        CREATE TABLE IF NOT EXISTS users (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            name VARCHAR(100),
-            email VARCHAR(100) UNIQUE,
-            password VARCHAR(100),
-            has_voted BOOLEAN DEFAULT 0
-        );
-        CREATE TABLE IF NOT EXISTS positions (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            name VARCHAR(100),
-            category VARCHAR(100)
-        );
-        CREATE TABLE IF NOT EXISTS candidates (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            name VARCHAR(100),
-            image VARCHAR(255),
-            position_id INT,
-            FOREIGN KEY (position_id) REFERENCES positions(id)
-        );
-        CREATE TABLE IF NOT EXISTS votes (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            user_id INT,
-            position_id INT,
-            candidate_id INT,
-            voted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (position_id) REFERENCES positions(id),
-            FOREIGN KEY (candidate_id) REFERENCES candidates(id),
-            UNIQUE KEY unique_vote (user_id, position_id)
-        );
-        """
-
-        for statement in schema.split(';'):
-            if statement.strip():
-                cursor.execute(statement)
-        db.commit()
-        cursor.close()
-        db.close()
-        print('Tables created or already exist.')
-    except Exception as e:
-        print('Error in initialize_db:', e)
-    print('--- initialize_db: Finished ---')
+        vote_log.append(ballots)
+    except Exception:
+        vote_log_failures.inc(len(ballots))
+        logger.critical('Could not append %d committed ballot(s) to the vote log %s; users %s',
+                        len(ballots), vote_log.path, [user_id for user_id, _ in ballots], exc_info=True)
+
+def record_ballots(ballots):
+    repo.record_ballots(ballots)
+    append_vote_log(ballots)
+
+# Optional write-behind vote ingestion (VOTE_INGEST_MODE=async): ballots are journaled
+# locally and acknowledged immediately, then written to storage in batches
+VOTE_INGEST_MODE = os.getenv('VOTE_INGEST_MODE', 'sync')
+vote_ingestor = None
+if VOTE_INGEST_MODE == 'async':
+    vote_ingestor = VoteIngestor(
+        record_ballots,
+        os.getenv('VOTE_INGEST_JOURNAL_DIR', os.path.join(os.path.dirname(__file__), 'journal')),
+        max_queue=int(os.getenv('VOTE_INGEST_QUEUE_DEPTH', 10000)),
+        batch_size=int(os.getenv('VOTE_INGEST_BATCH_SIZE', 500)),
+        flush_interval=float(os.getenv('VOTE_INGEST_FLUSH_INTERVAL', 0.05)),
+        fsync=os.getenv('VOTE_INGEST_FSYNC', '1') == '1',
+    )
+    vote_ingestor.start()
+
+# Candidate photos: uploads are validated, stored under content-hash names and resized to
+# small WebP/JPEG variants in the background; the candidate points at the new image only
+# once its variants exist. Files no candidate references any more are deleted.
+def candidate_images_in_use():
+    digests, after = set(), 0
+    while after is not None:
+        rows, after = repo.list_candidates(('id', 'image'), after=after, limit=1000)
+        digests.update(image_digest(row['image']) for row in rows)
+    return digests
+
+def release_image(image_url):
+    digest = image_digest(image_url)
+    if digest is None or image_pipeline.is_pending(digest) or digest in candidate_images_in_use():
+        return
+    removed = remove_image_files(app.config['UPLOAD_FOLDER'], digest)
+    logger.info('Removed %d unused image file(s) for %s', removed, digest)
+
+def apply_candidate_image(candidate_id, image_url):
+    candidate = repo.get_candidate(candidate_id)
+    if candidate is None:
+        release_image(image_url)
+        return
+    repo.set_candidate_image(candidate_id, image_url)
+    ballot_index.invalidate()
+    if candidate['image'] != image_url:
+        release_image(candidate['image'])
+
+image_pipeline = ImagePipeline(
+    UPLOAD_FOLDER,
+    on_ready=apply_candidate_image,
+    on_discard=release_image,
+    workers=int(os.getenv('IMAGE_WORKERS', 2)),
+    executor=os.getenv('IMAGE_EXECUTOR', 'thread'),
+    max_bytes=int(os.getenv('IMAGE_MAX_BYTES', MAX_IMAGE_BYTES)),
+)
+
+@app.route('/api/vote/ingest', methods=['GET'])
+def vote_ingest_stats():
+    if vote_ingestor is None:
+        return jsonify({'mode': VOTE_INGEST_MODE})
+    return jsonify(dict(vote_ingestor.stats(), mode=VOTE_INGEST_MODE))
+
+pool_gauge = registry.gauge('db_pool_connections', 'Connection pool state.')
+pool_events = registry.counter('db_pool_events_total', 'Connections created, recycled and acquire timeouts.')
+ingest_queue_depth = registry.gauge('vote_ingest_queue_depth', 'Ballots journaled but not yet written to MySQL.')
+ingest_events = registry.counter('vote_ingest_ballots_total', 'Write-behind ballots by outcome.')
+password_hash_pending = registry.gauge('password_hash_pending', 'Password hash/verify calls queued or running.')
+password_hash_calls = registry.counter('password_hash_calls_total', 'Password hash/verify calls by outcome.')
+user_cache_lookups = registry.counter('user_cache_lookups_total', 'Login user cache lookups by result.')
+admission_in_flight = registry.gauge('admission_in_flight', 'Login/vote requests holding an admission slot.')
+vote_log_records = registry.counter('vote_log_records_total', 'Votes appended to the audit log by this process.')
+vote_log_fsyncs = registry.counter('vote_log_fsyncs_total', 'fsync calls on the audit log by this process.')
+vote_log_failures = registry.counter('vote_log_failures_total', 'Committed ballots that could not be appended to the audit log.')
+admission_rejected = registry.counter('admission_rejected_total', 'Requests refused by admission control, by limit.')
+
+@registry.collector
+def collect_component_stats():
+    stats = repo.pool_stats()
+    if stats is not None:
+        for state in ('open', 'idle', 'in_use', 'waiting'):
+            pool_gauge.set(stats[state], state=state)
+        for event in ('created', 'recycled', 'timeouts'):
+            pool_events.set_total(stats[event], event=event)
+    if vote_ingestor is not None:
+        stats = vote_ingestor.stats()
+        ingest_queue_depth.set(stats['queued'])
+        for outcome in ('accepted', 'written', 'rejected', 'failed'):
+            ingest_events.set_total(stats[outcome], outcome=outcome)
+    stats = password_hasher.stats()
+    password_hash_pending.set(stats['pending'])
+    for outcome in ('completed', 'rejected'):
+        password_hash_calls.set_total(stats[outcome], outcome=outcome)
+    stats = user_cache.stats()
+    user_cache_lookups.set_total(stats['hits'], result='hit')
+    user_cache_lookups.set_total(stats['misses'], result='miss')
+    if vote_log is not None:
+        stats = vote_log.stats()
+        vote_log_records.set_total(stats['records'])
+        vote_log_fsyncs.set_total(stats['fsyncs'])
+    stats = admission.stats()
+    admission_in_flight.set(stats['in_flight'] or 0)
+    for entry in stats['rejected']:
+        admission_rejected.set_total(entry['count'], limit=entry['limit'], route=entry['route'])
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
 
-def populate_sample_data():
-    print('--- populate_sample_data: Starting ---')
+def initialize_db():
+    # Applies pending schema migrations; a single query when the schema is current
     try:
-        db = get_db_with_database()
-        cursor = db.cursor()
-        # Check if users table is empty
-        cursor.execute('SELECT COUNT(*) FROM users')
-        if cursor.fetchone()[0] == 0:
-            cursor.execute("""
-                INSERT INTO users (name, email, password, has_voted) VALUES
-                ('John Doe', 'john@example.com', 'Password123', 0),
-                ('Jane Smith', 'jane@example.com', 'Password123', 0)
-            """)
-        # Check if positions table is empty
-        cursor.execute('SELECT COUNT(*) FROM positions')
-        if cursor.fetchone()[0] == 0:
-            cursor.execute("""
-                INSERT INTO positions (name, category) VALUES
-                ('President', 'students'),
-                ('Secretary', 'students'),
-                ('Head Teacher', 'teachers'),
-                ('Staff Rep', 'staff')
-            """)
-        # Check if candidates table is empty
-        cursor.execute('SELECT COUNT(*) FROM candidates')
-        if cursor.fetchone()[0] == 0:
-            # Get position ids
-            cursor.execute('SELECT id FROM positions WHERE name="President"')
-            president_id = cursor.fetchone()[0]
-            cursor.execute('SELECT id FROM positions WHERE name="Secretary"')
-            secretary_id = cursor.fetchone()[0]
-            cursor.execute('SELECT id FROM positions WHERE name="Head Teacher"')
-            head_teacher_id = cursor.fetchone()[0]
-            cursor.execute('SELECT id FROM positions WHERE name="Staff Rep"')
-            staff_rep_id = cursor.fetchone()[0]
-            cursor.execute(f"""
-                INSERT INTO candidates (name, image, position_id) VALUES
-                    ('Alice', NULL, {president_id}),
-                    ('Bob', NULL, {president_id}),
-                    ('Carol', NULL, {secretary_id}),
-                    ('Dave', NULL, {secretary_id}),
-                    ('Ms. Johnson', NULL, {head_teacher_id}),
-                    ('Mr. Smith', NULL, {head_teacher_id}),
-                    ('Ms. Green', NULL, {staff_rep_id}),
-                    ('Mr. Brown', NULL, {staff_rep_id})
-            """)
-        # Remove images for candidates with id 5, 6, 7, and 8 (force initials display)
-        cursor.execute('UPDATE candidates SET image=NULL WHERE id IN (5, 6, 7, 8)')
-        db.commit()
-        cursor.close()
-        db.close()
-        print('Sample data populated.')
+        applied = repo.initialize()
+        if applied:
+            logger.info('Applied schema migrations %s', applied)
     except Exception as e:
-        print('Error in populate_sample_data:', e)
-    print('--- populate_sample_data: Finished ---')
+        logger.exception('Error in initialize_db: %s', e)
+
+USER_FIELDS = ('id', 'name', 'email', 'has_voted')
+CANDIDATE_FIELDS = ('id', 'name', 'image', 'position_id')
+
+def public_user(user):
+    return {field: user[field] for field in USER_FIELDS}
+
+def login_response(user):
+    return {'success': True, 'user': public_user(user), 'token': session_signer.issue(user['id']),
+            'expires_in': session_signer.ttl}
 
 @app.route('/api/login', methods=['POST'])
+@admitted('login')
 def login():
     data = request.json
     email = data.get('email')
     password = data.get('password')
-    print(f"Login attempt: email={email}, password={password}")
-    db = get_db_with_database()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM users WHERE email=%s AND password=%s', (email, password))
-    user = cursor.fetchone()
+    if not email or not password:
+        return jsonify({'success': False, 'message': 'Email and password are required.'}), 400
+    admission.check_subject('login', email)
+    user = user_cache.get(email) or repo.get_user_by_email(email)
     if not user:
-        # Try to find by email only
-        cursor.execute('SELECT * FROM users WHERE email=%s', (email,))
-        user = cursor.fetchone()
-        if not user:
-            # Auto-insert new user
-            print(f"Inserting new user: {email}")
-            cursor.execute('INSERT INTO users (name, email, password, has_voted) VALUES (%s, %s, %s, 0)', (email.split('@')[0], email, password))
-            db.commit()
-            cursor.execute('SELECT * FROM users WHERE email=%s', (email,))
-            user = cursor.fetchone()
-        elif user['password'] != password:
-            print(f"Invalid password for {email}")
-            cursor.close()
-            db.close()
-            return jsonify({'success': False, 'message': 'Invalid credentials'}), 401
-    print(f"User found or created: {user}")
-    cursor.close()
-    db.close()
-    return jsonify({'success': True, 'user': user})
+        # Auto-insert new user
+        logger.info('Auto-creating user %s', email)
+        try:
+            user = repo.create_user(email.split('@')[0], email, password_hasher.hash(password))
+            user_cache.put(user)
+            return jsonify(login_response(user))
+        except DuplicateEmail:
+            # Created concurrently by another request
+            user = repo.get_user_by_email(email)
+    matches, new_hash = password_hasher.verify(user['password'], password)
+    if not matches:
+        logger.info('Invalid password for %s', email)
+        return jsonify({'success': False, 'message': 'Invalid credentials'}), 401
+    if new_hash:
+        repo.set_password(user['id'], new_hash)
+        user['password'] = new_hash
+    user_cache.put(user)
+    return jsonify(login_response(user))
+
+def resolve_voter(data, authorization):
+    # The voter is whoever the session token names; a user_id in the body must agree.
+    # With VOTE_REQUIRE_TOKEN=0, clients that predate tokens may still send only user_id.
+    token = bearer_token(authorization) or data.get('token')
+    if token is None:
+        if VOTE_REQUIRE_TOKEN:
+            raise InvalidToken('Missing session token, please log in again.')
+        return data.get('user_id')
+    user_id = session_signer.verify(token)
+    if data.get('user_id') not in (None, '') and str(data['user_id']) != str(user_id):
+        raise InvalidToken('Session token does not match user_id.')
+    return user_id
 
 @app.route('/api/vote', methods=['POST'])
+@admitted('vote')
 def vote():
     data = request.json
-    print("Received vote data:", data)  # Debug log
-    user_id = data.get('user_id')
+    user_id = resolve_voter(data, request.headers.get('Authorization'))
+    admission.check_subject('vote', user_id)
     votes = data.get('votes')  # {position_id: candidate_id}
-    db = get_db_with_database()
-    cursor = db.cursor()
     try:
-        # Get user name for logging
-        cursor.execute('SELECT name, email FROM users WHERE id=%s', (user_id,))
-        user_info = cursor.fetchone()
-        user_name = user_info[0] if user_info else f"User {user_id}"
-        print(f"User {user_name} (ID: {user_id}) is voting...")
-        
-        for position_id, candidate_id in votes.items():
-            # Get position and candidate names for logging
-            cursor.execute('SELECT name FROM positions WHERE id=%s', (position_id,))
-            position_name = cursor.fetchone()[0]
-            cursor.execute('SELECT name FROM candidates WHERE id=%s', (candidate_id,))
-            candidate_name = cursor.fetchone()[0]
-            
-            print(f"Vote: {user_name} voted for {candidate_name} as {position_name}")
-            cursor.execute('INSERT INTO votes (user_id, position_id, candidate_id) VALUES (%s, %s, %s) ON DUPLICATE KEY UPDATE candidate_id=VALUES(candidate_id)', (user_id, position_id, candidate_id))
-        cursor.execute('UPDATE users SET has_voted=1 WHERE id=%s', (user_id,))
-        db.commit()
-        print(f"Vote saved successfully for {user_name}")
+        user_id, votes = normalize_ballot(user_id, votes)
+        ballot = ballot_index.current()
+        ballot.validate(votes)
+    except InvalidBallot as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if vote_ingestor is not None:
+        try:
+            vote_ingestor.submit(user_id, votes)
+        except IngestQueueFull:
+            response = jsonify({'success': False, 'message': 'Server is busy, please try again.'})
+            response.status_code = 503
+            response.headers['Retry-After'] = '1'
+            return response
+        ballots_total.inc(path='queued')
+        user_cache.invalidate(user_id=user_id)
+        return jsonify({'success': True, 'queued': True}), 202
+    try:
+        record_ballots([(user_id, votes)])
+        ballots_total.inc(path='sync')
+        user_cache.invalidate(user_id=user_id)
+    except PoolExhausted:
+        raise
     except Exception as e:
-        print("Error while saving vote:", e)  # Debug log
-        db.rollback()
+        logger.error('Error while saving vote for user %s: %s', user_id, e)
         return jsonify({'success': False, 'message': str(e)}), 500
-    finally:
-        cursor.close()
-        db.close()
     return jsonify({'success': True})
 
+def load_results():
+    return repo.results()
+
 @app.route('/api/results', methods=['GET'])
 def results():
-    db = get_db_with_database()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute('''
-        SELECT p.id as position_id, p.name as position_name, c.id as candidate_id, c.name as candidate_name, COUNT(v.id) as votes
-        FROM positions p
-        JOIN candidates c ON c.position_id = p.id
-        LEFT JOIN votes v ON v.position_id = p.id AND v.candidate_id = c.id
-        GROUP BY p.id, c.id
-    ''')
-    results = cursor.fetchall()
-    cursor.close()
-    db.close()
-    return jsonify({'results': results})
+    return jsonify({'results': load_results()})
+
+# One producer polls the tallies and fans snapshot/diff events out to every SSE client.
+# Under gunicorn (gunicorn.conf.py, gevent workers) open streams are greenlets, not threads.
+results_broadcaster = ResultsBroadcaster(
+    load_results,
+    interval=float(os.getenv('RESULTS_STREAM_INTERVAL', 1)),
+    heartbeat=float(os.getenv('RESULTS_STREAM_HEARTBEAT', 15)),
+)
+
+@app.route('/api/results/stream', methods=['GET'])
+def results_stream():
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    response = Response(results_broadcaster.stream(last_event_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+BALLOT_CACHE_MAX_AGE = int(os.getenv('BALLOT_CACHE_MAX_AGE', 10))
 
 @app.route('/api/positions', methods=['GET'])
 def get_positions():
-    db = get_db_with_database()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM positions')
-    positions = cursor.fetchall()
-    for pos in positions:
-        cursor.execute('SELECT * FROM candidates WHERE position_id=%s', (pos['id'],))
-        pos['candidates'] = cursor.fetchall()
-    cursor.close()
-    db.close()
-    return jsonify({'positions': positions})
+    # Served from the ballot index; revalidation with If-None-Match never touches MySQL
+    # unless the ballot version check interval has elapsed
+    ballot = ballot_index.current()
+    body = ballot.body(app.json.dumps)
+    use_gzip = request.accept_encodings.quality('gzip') > 0
+    etag = ballot.etag + ('-gz' if use_gzip else '')
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(ballot.gzip_body(app.json.dumps) if use_gzip else body, mimetype='application/json')
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={BALLOT_CACHE_MAX_AGE}, must-revalidate'
+    response.vary.add('Accept-Encoding')
+    return response
 
 @app.route('/api/users', methods=['POST'])
 def add_user():
@@ -253,62 +520,113 @@ def add_user():
     name = data.get('name') or email.split('@')[0]
     if not email or not password:
         return jsonify({'success': False, 'message': 'Email and password are required.'}), 400
-    db = get_db_with_database()
-    cursor = db.cursor(dictionary=True)
     try:
-        cursor.execute('SELECT * FROM users WHERE email=%s', (email,))
-        if cursor.fetchone():
-            return jsonify({'success': False, 'message': 'Email already exists.'}), 409
-        cursor.execute('INSERT INTO users (name, email, password, has_voted) VALUES (%s, %s, %s, 0)', (name, email, password))
-        db.commit()
-        cursor.execute('SELECT * FROM users WHERE email=%s', (email,))
-        user = cursor.fetchone()
-        return jsonify({'success': True, 'user': user})
+        user = repo.create_user(name, email, password_hasher.hash(password))
+        user_cache.invalidate(email=email)
+        return jsonify({'success': True, 'user': public_user(user)})
+    except DuplicateEmail:
+        return jsonify({'success': False, 'message': 'Email already exists.'}), 409
+    except PoolExhausted:
+        raise
     except Exception as e:
-        db.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
-    finally:
-        cursor.close()
-        db.close()
+
+@app.errorhandler(BadListingRequest)
+def handle_bad_listing_request(e):
+    return jsonify({'success': False, 'message': str(e)}), 400
 
 @app.route('/api/users', methods=['GET'])
 def get_users():
-    db = get_db_with_database()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM users')
-    users = cursor.fetchall()
-    cursor.close()
-    db.close()
-    return jsonify({'users': users})
+    # Keyset-paginated: pass next_cursor back as ?after= to get the following page
+    limit, after = parse_page_args(request.args)
+    fields = parse_fields(request.args, USER_FIELDS, USER_FIELDS)
+    has_voted = request.args.get('has_voted')
+    users, next_cursor = repo.list_users(
+        fields, after=after, limit=limit,
+        has_voted=int(has_voted) if has_voted in ('0', '1') else None,
+        email_prefix=request.args.get('email_prefix') or None)
+    return jsonify({'users': users, 'next_cursor': next_cursor})
+
+@app.route('/api/users/summary', methods=['GET'])
+def users_summary():
+    total, voted = repo.count_users()
+    positions = repo.position_turnout()
+    categories = {}
+    for pos in positions:
+        pos['turnout'] = round(pos['voters'] / total, 4) if total else 0
+        # Category turnout: voters in the category's most-voted position
+        cat = categories.setdefault(pos['category'], {'category': pos['category'], 'voters': 0})
+        cat['voters'] = max(cat['voters'], pos['voters'])
+    for cat in categories.values():
+        cat['turnout'] = round(cat['voters'] / total, 4) if total else 0
+    return jsonify({
+        'total': total,
+        'voted': voted,
+        'turnout': round(voted / total, 4) if total else 0,
+        'positions': positions,
+        'categories': list(categories.values()),
+    })
+
+@app.route('/api/users/import', methods=['POST'])
+def import_users_route():
+    # Accepts a multipart 'file' upload or a raw request body; rows are streamed, never fully loaded
+    upload = request.files.get('file')
+    stream = upload.stream if upload else request.stream
+    default_format = 'ndjson' if 'ndjson' in (request.mimetype or '') else 'csv'
+    fmt = request.args.get('format') or detect_format(upload.filename if upload else None, default_format)
+    mode = request.args.get('mode', 'ignore')
+    if fmt not in ('csv', 'ndjson') or mode not in ('ignore', 'upsert'):
+        return jsonify({'success': False, 'message': 'format must be csv/ndjson and mode ignore/upsert.'}), 400
+    try:
+        chunk_size = int(request.args.get('chunk_size', 1000))
+    except ValueError:
+        chunk_size = 0
+    if chunk_size < 1:
+        return jsonify({'success': False, 'message': 'chunk_size must be a positive integer.'}), 400
+    try:
+        report = import_users(repo, iter_records(stream, fmt), mode=mode, chunk_size=chunk_size,
+                              hash_passwords=password_hasher.hash_many)
+    except UnicodeDecodeError as e:
+        return jsonify({'success': False, 'message': f'File is not valid UTF-8: {e}'}), 400
+    finally:
+        user_cache.clear()
+    return jsonify({'success': True, 'report': report})
+
+@app.route('/api/users/export', methods=['GET'])
+def export_users_route():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'message': 'format must be csv or ndjson.'}), 400
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    response = Response(export_users(repo, fmt), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=users.{fmt}'
+    return response
 
 @app.route('/api/users/<int:user_id>', methods=['DELETE'])
 def delete_user(user_id):
-    db = get_db_with_database()
-    cursor = db.cursor()
     try:
-        # Check if user has votes
-        cursor.execute('SELECT COUNT(*) FROM votes WHERE user_id=%s', (user_id,))
-        if cursor.fetchone()[0] > 0:
-            return jsonify({'success': False, 'message': 'Cannot delete user who has voted.'}), 400
-        cursor.execute('DELETE FROM users WHERE id=%s', (user_id,))
-        db.commit()
+        repo.delete_user(user_id)
+        user_cache.invalidate(user_id=user_id)
         return jsonify({'success': True})
+    except UserHasVoted:
+        return jsonify({'success': False, 'message': 'Cannot delete user who has voted.'}), 400
+    except PoolExhausted:
+        raise
     except Exception as e:
-        db.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
-    finally:
-        cursor.close()
-        db.close()
 
 @app.route('/api/candidates', methods=['GET'])
 def get_candidates():
-    db = get_db_with_database()
-    cursor = db.cursor(dictionary=True)
-    cursor.execute('SELECT * FROM candidates')
-    candidates = cursor.fetchall()
-    cursor.close()
-    db.close()
-    return jsonify({'candidates': candidates})
+    limit, after = parse_page_args(request.args)
+    fields = parse_fields(request.args, CANDIDATE_FIELDS, CANDIDATE_FIELDS)
+    position_id = None
+    if request.args.get('position_id'):
+        try:
+            position_id = int(request.args['position_id'])
+        except ValueError:
+            return jsonify({'success': False, 'message': 'position_id must be an integer.'}), 400
+    candidates, next_cursor = repo.list_candidates(fields, after=after, limit=limit, position_id=position_id)
+    return jsonify({'candidates': candidates, 'next_cursor': next_cursor})
 
 @app.route('/api/candidates/<int:candidate_id>', methods=['PUT'])
 def update_candidate(candidate_id):
@@ -316,32 +634,16 @@ def update_candidate(candidate_id):
     name = data.get('name')
     position_id = data.get('position_id')
     image = data.get('image')  # Optional: path or URL
-    db = get_db_with_database()
-    cursor = db.cursor()
+    if not (name or position_id or image):
+        return jsonify({'success': False, 'message': 'No fields to update.'}), 400
     try:
-        update_fields = []
-        params = []
-        if name:
-            update_fields.append('name=%s')
-            params.append(name)
-        if position_id:
-            update_fields.append('position_id=%s')
-            params.append(position_id)
-        if image:
-            update_fields.append('image=%s')
-            params.append(image)
-        if not update_fields:
-            return jsonify({'success': False, 'message': 'No fields to update.'}), 400
-        params.append(candidate_id)
-        cursor.execute(f"UPDATE candidates SET {', '.join(update_fields)} WHERE id=%s", tuple(params))
-        db.commit()
+        repo.update_candidate(candidate_id, name=name, position_id=position_id, image=image)
+        ballot_index.invalidate()
         return jsonify({'success': True})
+    except PoolExhausted:
+        raise
     except Exception as e:
-        db.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
-    finally:
-        cursor.close()
-        db.close()
 
 @app.route('/api/candidates/<int:candidate_id>/image', methods=['POST'])
 def upload_candidate_image(candidate_id):
@@ -350,41 +652,35 @@ def upload_candidate_image(candidate_id):
     file = request.files['image']
     if file.filename == '':
         return jsonify({'success': False, 'message': 'No selected file.'}), 400
-    if file and allowed_file(file.filename):
-        filename = secure_filename(f"candidate_{candidate_id}_" + file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        # Update candidate image path in DB (store relative path)
-        db = get_db_with_database()
-        cursor = db.cursor()
-        try:
-            image_url = f'/uploads/{filename}'
-            cursor.execute('UPDATE candidates SET image=%s WHERE id=%s', (image_url, candidate_id))
-            db.commit()
-            return jsonify({'success': True, 'image': image_url})
-        except Exception as e:
-            db.rollback()
-            return jsonify({'success': False, 'message': str(e)}), 500
-        finally:
-            cursor.close()
-            db.close()
-    else:
+    if not (file and allowed_file(file.filename)):
         return jsonify({'success': False, 'message': 'Invalid file type.'}), 400
+    try:
+        if repo.get_candidate(candidate_id) is None:
+            return jsonify({'success': False, 'message': 'Candidate not found.'}), 404
+        # The original is usable right away; the ballot switches over once variants are ready
+        image_url = image_pipeline.submit(candidate_id, file.read(image_pipeline.max_bytes + 1))
+        return jsonify({'success': True, 'image': image_url, 'processing': True}), 202
+    except InvalidImage as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except PoolExhausted:
+        raise
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
 
 @app.route('/api/candidates/<int:candidate_id>/remove_image', methods=['PATCH'])
 def remove_candidate_image(candidate_id):
-    db = get_db_with_database()
-    cursor = db.cursor()
     try:
-        cursor.execute('UPDATE candidates SET image=NULL WHERE id=%s', (candidate_id,))
-        db.commit()
+        image_pipeline.cancel(candidate_id)
+        candidate = repo.get_candidate(candidate_id)
+        repo.set_candidate_image(candidate_id, None)
+        ballot_index.invalidate()
+        if candidate is not None:
+            release_image(candidate['image'])
         return jsonify({'success': True})
+    except PoolExhausted:
+        raise
     except Exception as e:
-        db.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
-    finally:
-        cursor.close()
-        db.close()
 
 @app.route('/api/candidates', methods=['POST'])
 def add_candidate():
@@ -397,37 +693,171 @@ def add_candidate():
     # Only set image if a real image is provided
     if image is not None and (not isinstance(image, str) or image.strip() == ''):
         image = None
-    db = get_db_with_database()
-    cursor = db.cursor()
     try:
-        cursor.execute('INSERT INTO candidates (name, image, position_id) VALUES (%s, %s, %s)', (name, image, position_id))
-        db.commit()
-        candidate_id = cursor.lastrowid
+        candidate_id = repo.add_candidate(name, image, position_id)
+        ballot_index.invalidate()
         return jsonify({'success': True, 'candidate_id': candidate_id})
+    except PoolExhausted:
+        raise
     except Exception as e:
-        db.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
-    finally:
-        cursor.close()
-        db.close()
 
 @app.route('/api/candidates/<int:candidate_id>', methods=['DELETE'])
 def delete_candidate(candidate_id):
-    db = get_db_with_database()
-    cursor = db.cursor()
     try:
-        cursor.execute('DELETE FROM candidates WHERE id=%s', (candidate_id,))
-        db.commit()
+        image_pipeline.cancel(candidate_id)
+        candidate = repo.get_candidate(candidate_id)
+        repo.delete_candidate(candidate_id)
+        ballot_index.invalidate()
+        if candidate is not None:
+            release_image(candidate['image'])
         return jsonify({'success': True})
+    except PoolExhausted:
+        raise
     except Exception as e:
-        db.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
-    finally:
-        cursor.close()
-        db.close()
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Apply pending schema migrations."""
+    applied = repo.initialize()
+    click.echo(f'Applied migrations {applied}.' if applied else 'Schema is up to date.')
+    click.echo(f'Schema version: {repo.schema_version()}')
+
+@app.cli.command('seed-sample-data')
+def seed_sample_data_command():
+    """Add the demo voters, positions and candidates to an empty database."""
+    repo.initialize()
+    repo.seed_sample_data()
+    click.echo('Sample data populated.')
+
+@app.cli.command('recount')
+@click.option('--dry-run', is_flag=True, help='Only report drift, do not rebuild the tallies table.')
+def recount_command(dry_run):
+    """Rebuild the tallies table from votes and report any drift."""
+    drift = repo.tally_drift()
+    for position_id, candidate_id, stored, actual in drift:
+        click.echo(f'position {position_id} candidate {candidate_id}: tally {stored}, votes {actual}')
+    click.echo(f'{len(drift)} tally row(s) drifted.')
+    if not dry_run:
+        repo.rebuild_tallies()
+        click.echo('Tallies rebuilt from votes.')
+
+@app.cli.command('audit-votes')
+@click.option('--log', 'log_path', type=click.Path(exists=True, dir_okay=False),
+              help='Defaults to the VOTE_LOG_PATH this app writes.')
+@click.option('--workers', type=int, default=os.cpu_count(), show_default=True)
+@click.option('--chunk-records', type=int, default=1 << 20, show_default=True)
+@click.option('--results-url', help='Check a deployed /api/results instead of this database\'s results.')
+def audit_votes_command(log_path, workers, chunk_records, results_url):
+    """Recount the election from the vote log and check it against the votes table and results."""
+    from vote_audit import MAX_REPORTED, audit  # NumPy is only needed for the offline audit
+    log_path = log_path or (vote_log.path if vote_log is not None else None)
+    if log_path is None:
+        raise click.UsageError('VOTE_LOG is disabled; pass --log.')
+    if results_url:
+        with urllib.request.urlopen(results_url, timeout=30) as resp:
+            results = json.load(resp)['results']
+    else:
+        results = load_results()
+    try:
+        report = audit(log_path, repo.iter_votes(), results, workers=workers, chunk_records=chunk_records)
+    except InvalidLog as e:
+        raise click.ClickException(f'{log_path}: {e}')
+    problems = 0
+    for label, items, fmt in (
+            ('record(s) fail the hash chain', [(seq,) for seq in report['broken']], 'seq {}'),
+            ('record(s) out of sequence', [(seq,) for seq in report['out_of_sequence']], 'seq {}'),
+            ('vote(s) differ from the votes table', report['vote_discrepancies'],
+             'user {} position {}: log {}, table {}'),
+            ('result row(s) differ from the recount', report['result_discrepancies'],
+             'position {} candidate {}: published {}, recount {}')):
+        for item in items[:MAX_REPORTED]:
+            click.echo('  ' + fmt.format(*item))
+        if len(items) > MAX_REPORTED:
+            click.echo(f'  ... and {len(items) - MAX_REPORTED} more')
+        click.echo(f'{len(items)} {label}.')
+        problems += len(items)
+    if report['torn_bytes']:
+        click.echo(f"{report['torn_bytes']} trailing byte(s) do not form a whole record.")
+        problems += 1
+    elapsed = report['elapsed_seconds']
+    click.echo(f"Replayed {report['records']} record(s) into {len(report['keys'])} vote(s) "
+               f"({report['table_votes']} in the votes table) from {report['chunks']} chunk(s) in {elapsed:.3f}s: "
+               f"{report['records'] / elapsed:,.0f} records/s, {report['bytes'] / elapsed / 2 ** 20:,.1f} MiB/s; "
+               f"comparison {report['compare_seconds']:.3f}s.")
+    click.echo(f"Log head: {report['head']}")
+    if problems:
+        raise click.ClickException('Audit found discrepancies.')
+    click.echo('Audit passed: the log, the votes table and the results agree.')
+
+@app.cli.command('process-images')
+def process_images_command():
+    """Move candidate photos uploaded before the image pipeline to content-hash variants."""
+    after, moved = 0, 0
+    while after is not None:
+        rows, after = repo.list_candidates(('id', 'image'), after=after, limit=1000)
+        for row in rows:
+            image = row['image'] or ''
+            if not image.startswith('/uploads/') or image_digest(image) is not None:
+                continue
+            path = os.path.join(app.config['UPLOAD_FOLDER'], os.path.basename(image))
+            try:
+                with open(path, 'rb') as f:
+                    image_url = image_pipeline.process(f.read())
+            except (OSError, InvalidImage) as e:
+                click.echo(f"candidate {row['id']}: skipped {image}: {e}", err=True)
+                continue
+            repo.set_candidate_image(row['id'], image_url)
+            os.remove(path)
+            moved += 1
+    click.echo(f'{moved} image(s) processed.')
+
+@app.cli.command('import-users')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension.')
+@click.option('--mode', type=click.Choice(['ignore', 'upsert']), default='ignore', show_default=True)
+@click.option('--chunk-size', type=int, default=1000, show_default=True)
+def import_users_command(path, fmt, mode, chunk_size):
+    """Bulk-import voters from a CSV or NDJSON file (columns: name, email, password)."""
+    def progress(report):
+        click.echo(f"{report['processed']} rows processed, {report['inserted']} inserted, "
+                   f"{report['failed']} failed ({report['rows_per_second']} rows/s)", err=True)
+    with open(path, 'rb') as f:
+        report = import_users(repo, iter_records(f, fmt or detect_format(path)), mode=mode,
+                              chunk_size=chunk_size, on_progress=progress, hash_passwords=password_hasher.hash_many)
+    for error in report['errors']:
+        click.echo(f"line {error['line']}: {error['message']}", err=True)
+    click.echo(f"Done: {report['processed']} processed, {report['inserted']} inserted, {report['upserted']} upserted, "
+               f"{report['skipped']} skipped, {report['failed']} failed in {report['elapsed_seconds']}s "
+               f"({report['rows_per_second']} rows/s)")
+
+@app.cli.command('hash-passwords')
+@click.option('--batch-size', type=int, default=500, show_default=True)
+def hash_passwords_command(batch_size):
+    """Replace any plaintext passwords left in the users table with scrypt hashes."""
+    after, upgraded = 0, 0
+    while True:
+        rows, after = repo.list_users(('id', 'password'), after=after, limit=batch_size)
+        legacy = [row for row in rows if row['password'] and not is_hashed(row['password'])]
+        for row, hashed in zip(legacy, password_hasher.hash_many([row['password'] for row in legacy])):
+            repo.set_password(row['id'], hashed)
+        upgraded += len(legacy)
+        if after is None:
+            break
+    user_cache.clear()
+    click.echo(f'{upgraded} password(s) hashed.')
+
+@app.cli.command('export-users')
+@click.argument('output', type=click.File('w'), default='-')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default='csv', show_default=True)
+def export_users_command(output, fmt):
+    """Stream the users table (without passwords) to a file or stdout."""
+    for chunk in export_users(repo, fmt):
+        output.write(chunk)
 
 if __name__ == '__main__':
+    # Development server, one thread per request; run `gunicorn app:app` in production
     initialize_db()
-    populate_sample_data()
     port = int(os.environ.get("PORT", 5000))  # Render sets PORT env var
     app.run(debug=False, host='0.0.0.0', port=port)
@@ -0,0 +1,447 @@
+"""Async (ASGI) serving mode.
+
+login, vote, results and positions run as coroutines on an async storage pool (aiomysql
+for MySQL), and /api/results/stream is served natively so an open stream holds no thread;
+every other route, including the admin API and /metrics, is handed to the Flask app
+through a WSGI bridge. The API surface is unchanged.
+
+Under uvicorn SESSION_SECRET is required (importing the app raises RuntimeError without
+it), and every worker must be given the same value; only `python asgi.py` falls back to a
+random per-process secret.
+
+    cd Backend
+    SESSION_SECRET=... uvicorn asgi:app --host 0.0.0.0 --port 5000 --timeout-graceful-shutdown 30
+    python asgi.py        # same, after initializing the database like app.py does
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+
+import app as flask_module
+from credentials import HasherBusy
+from db_pool import PoolExhausted
+from sessions import InvalidToken
+from observability import registry, current_request, RequestStats
+from rate_limit import Throttled
+from storage import create_async_repository, DuplicateEmail
+from vote_ingest import IngestQueueFull, InvalidBallot, normalize_ballot
+
+logger = logging.getLogger('voting.asgi')
+
+ASYNC_MAX_IN_FLIGHT = int(os.getenv('ASYNC_MAX_IN_FLIGHT', 512))  # beyond this, shed load with 503
+ASYNC_REQUEST_TIMEOUT = float(os.getenv('ASYNC_REQUEST_TIMEOUT', 10))
+ASYNC_SHUTDOWN_TIMEOUT = float(os.getenv('ASYNC_SHUTDOWN_TIMEOUT', 30))
+ASYNC_WSGI_WORKERS = int(os.getenv('ASYNC_WSGI_WORKERS', 10))
+MAX_BODY_BYTES = 1024 * 1024
+
+
+def create_default_repository():
+    if flask_module.STORAGE_BACKEND == 'mysql':
+        return create_async_repository(
+            'mysql',
+            config=flask_module.DB_CONFIG,
+            database=flask_module.DB_NAME,
+            pool_size=int(os.getenv('DB_POOL_SIZE', 10)),
+            pool_timeout=float(os.getenv('DB_POOL_TIMEOUT', 5)),
+            recycle=float(os.getenv('DB_POOL_RECYCLE', 1800)),
+        )
+    return create_async_repository(flask_module.STORAGE_BACKEND, repo=flask_module.repo,
+                                   pool_size=int(os.getenv('DB_POOL_SIZE', 10)))
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=()):
+        super().__init__(message)
+        self.status = status
+        self.headers = list(headers)
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+        self.client = (scope.get('client') or (None,))[0]  # uvicorn --proxy-headers resolves X-Forwarded-For
+        self.body = body
+
+    def json(self):
+        try:
+            data = json.loads(self.body or b'null')
+        except ValueError:
+            raise HTTPError(400, 'Invalid JSON body.')
+        if not isinstance(data, dict):
+            raise HTTPError(400, 'Expected a JSON object.')
+        return data
+
+
+class Response:
+    def __init__(self, body=b'', status=200, headers=None, content_type='application/json'):
+        self.body = body
+        self.status = status
+        self.headers = dict(headers or {})
+        if content_type and body:
+            self.headers.setdefault('Content-Type', content_type)
+
+
+def accepts_gzip(header):
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip().lower() in ('gzip', '*'):
+            q = params.strip()
+            return not (q.startswith('q=') and float(q[2:] or 0) == 0)
+    return False
+
+
+def etag_matches(header, etag):
+    if not header:
+        return False
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag == '*' or tag.removeprefix('W/').strip('"') == etag:
+            return True
+    return False
+
+
+class AsyncVotingApp:
+    def __init__(self, async_repo, wsgi_app=flask_module.app, max_in_flight=ASYNC_MAX_IN_FLIGHT,
+                 request_timeout=ASYNC_REQUEST_TIMEOUT, shutdown_timeout=ASYNC_SHUTDOWN_TIMEOUT):
+        self.repo = async_repo
+        self.fallback = WSGIMiddleware(wsgi_app, workers=ASYNC_WSGI_WORKERS)
+        self.dumps = wsgi_app.json.dumps
+        self.max_in_flight = max_in_flight
+        self.request_timeout = request_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.in_flight = 0
+        self.shed = 0
+        self.draining = False
+        self._pending_votes = set()
+        self._streams = set()
+        self.routes = {
+            ('POST', '/api/login'): self.login,
+            ('POST', '/api/vote'): self.vote,
+            ('GET', '/api/results'): self.results,
+            ('GET', '/api/positions'): self.positions,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return await self.fallback(scope, receive, send)
+        if self.draining:
+            return await self.send(send, self.error(503, 'Server is shutting down.', retry_after=True))
+        if (scope['method'], scope['path']) == ('GET', '/api/results/stream'):
+            return await self.results_stream(scope, receive, send)
+        handler = self.routes.get((scope['method'], scope['path']))
+        if handler is None:
+            return await self.fallback(scope, receive, send)
+        if self.in_flight >= self.max_in_flight:
+            # Backpressure: refuse early instead of queueing behind a saturated DB pool
+            self.shed += 1
+            flask_module.requests_total.inc(route=scope['path'], method=scope['method'], status=503)
+            return await self.send(send, self.error(503, 'Server is busy, please try again.', retry_after=True))
+        await self.handle(handler, scope, receive, send)
+
+    async def handle(self, handler, scope, receive, send):
+        self.in_flight += 1
+        flask_module.requests_in_flight.inc()
+        stats = RequestStats(keep_sql=flask_module.SLOW_REQUEST_SECONDS > 0)
+        token = current_request.set(stats)
+        route, method = scope['path'], scope['method']
+        try:
+            try:
+                request = Request(scope, await self.read_body(receive))
+                response = await asyncio.wait_for(handler(request), self.request_timeout)
+            except HTTPError as e:
+                response = self.error(e.status, str(e))
+                response.headers.update(e.headers)
+            except Throttled as e:
+                response = self.error(e.status, str(e))
+                response.headers['Retry-After'] = e.retry_after_header
+            except InvalidToken as e:
+                response = self.error(401, str(e))
+            except (PoolExhausted, IngestQueueFull, HasherBusy):
+                response = self.error(503, 'Server is busy, please try again.', retry_after=True)
+            except asyncio.TimeoutError:
+                response = self.error(504, 'Request timed out.')
+            except Exception:
+                logger.exception('Unhandled error in %s %s', method, route)
+                response = self.error(500, 'Internal server error.')
+            await self.send(send, response)
+        finally:
+            current_request.reset(token)
+            self.in_flight -= 1
+            flask_module.requests_in_flight.dec()
+        elapsed = time.perf_counter() - stats.started
+        flask_module.request_seconds.observe(elapsed, route=route, method=method)
+        flask_module.request_db_seconds.observe(stats.db_time, route=route, method=method)
+        flask_module.request_queries.observe(stats.queries, route=route, method=method)
+        flask_module.requests_total.inc(route=route, method=method, status=response.status)
+        if flask_module.SLOW_REQUEST_SECONDS and elapsed >= flask_module.SLOW_REQUEST_SECONDS:
+            logger.warning('Slow request %s %s: %.1fms total, %.1fms in %d queries; sql=%s',
+                           method, route, elapsed * 1000, stats.db_time * 1000, stats.queries, stats.statements)
+
+    async def read_body(self, receive):
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise HTTPError(400, 'Client disconnected.')
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise HTTPError(413, 'Request body too large.')
+            chunks.append(chunk)
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    def json_response(self, payload, status=200, headers=None):
+        return Response((self.dumps(payload) + '\n').encode('utf-8'), status, headers)
+
+    def error(self, status, message, retry_after=False):
+        return self.json_response({'success': False, 'message': message}, status,
+                                  {'Retry-After': '1'} if retry_after else None)
+
+    async def send(self, send, response):
+        headers = dict(response.headers)
+        headers['Content-Length'] = str(len(response.body))
+        headers.setdefault('Access-Control-Allow-Origin', '*')  # as Flask-CORS does for the WSGI routes
+        await send({'type': 'http.response.start', 'status': response.status,
+                    'headers': [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in headers.items()]})
+        await send({'type': 'http.response.body', 'body': response.body})
+
+    # Routes
+
+    async def login(self, request):
+        with flask_module.admission.admit('login', request.client):
+            return await self._login(request)
+
+    async def _login(self, request):
+        data = request.json()
+        email = data.get('email')
+        password = data.get('password')
+        if not email or not password:
+            raise HTTPError(400, 'Email and password are required.')
+        flask_module.admission.check_subject('login', email)
+        hasher, cache = flask_module.password_hasher, flask_module.user_cache
+        user = cache.get(email) or await self.repo.get_user_by_email(email)
+        if not user:
+            # Auto-insert new user
+            logger.info('Auto-creating user %s', email)
+            try:
+                user = await self.repo.create_user(email.split('@')[0], email, await hasher.hash_async(password))
+                cache.put(user)
+                return self.json_response(flask_module.login_response(user))
+            except DuplicateEmail:
+                user = await self.repo.get_user_by_email(email)
+        matches, new_hash = await hasher.verify_async(user['password'], password)
+        if not matches:
+            logger.info('Invalid password for %s', email)
+            return self.json_response({'success': False, 'message': 'Invalid credentials'}, 401)
+        if new_hash:
+            await self.repo.set_password(user['id'], new_hash)
+            user['password'] = new_hash
+        cache.put(user)
+        return self.json_response(flask_module.login_response(user))
+
+    async def vote(self, request):
+        with flask_module.admission.admit('vote', request.client):
+            return await self._vote(request)
+
+    async def _vote(self, request):
+        data = request.json()
+        user_id = flask_module.resolve_voter(data, request.headers.get('authorization'))
+        flask_module.admission.check_subject('vote', user_id)
+        try:
+            user_id, votes = normalize_ballot(user_id, data.get('votes'))
+            ballot = await flask_module.ballot_index.current_async(self.repo)
+            ballot.validate(votes)
+        except InvalidBallot as e:
+            return self.json_response({'success': False, 'message': str(e)}, 400)
+        ingestor = flask_module.vote_ingestor
+        if ingestor is not None:
+            # Journal append + group fsync block, so they run off the event loop
+            await self.track_vote(asyncio.get_running_loop().run_in_executor(None, ingestor.submit, user_id, votes))
+            flask_module.ballots_total.inc(path='queued')
+            flask_module.user_cache.invalidate(user_id=user_id)
+            return self.json_response({'success': True, 'queued': True}, 202)
+        try:
+            await self.track_vote(self.record_ballots([(user_id, votes)]))
+            flask_module.ballots_total.inc(path='sync')
+            flask_module.user_cache.invalidate(user_id=user_id)
+        except PoolExhausted:
+            raise
+        except Exception as e:
+            logger.error('Error while saving vote for user %s: %s', user_id, e)
+            return self.json_response({'success': False, 'message': str(e)}, 500)
+        return self.json_response({'success': True})
+
+    async def record_ballots(self, ballots):
+        # Same as app.record_ballots: commit, then append to the audit log off the event loop
+        await self.repo.record_ballots(ballots)
+        if flask_module.vote_log is not None:
+            await asyncio.get_running_loop().run_in_executor(None, flask_module.append_vote_log, ballots)
+
+    async def track_vote(self, awaitable):
+        # A started vote write always runs to completion: a request timeout or client
+        # disconnect only abandons the response, and shutdown waits for the write
+        task = asyncio.ensure_future(awaitable)
+        self._pending_votes.add(task)
+        task.add_done_callback(self._pending_votes.discard)
+        return await asyncio.shield(task)
+
+    async def results(self, request):
+        return self.json_response({'results': await self.repo.results()})
+
+    async def results_stream(self, scope, receive, send):
+        # Each open stream is a task waiting on the broadcaster, not one of the WSGI bridge's
+        # threads, so viewers cannot starve the admin routes. It ends when the client
+        # disconnects or the server begins shutting down.
+        request = Request(scope, b'')
+        query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+        last_event_id = request.headers.get('last-event-id') or (query.get('last_event_id') or [None])[0]
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'), (b'access-control-allow-origin', b'*')]})
+        pump = asyncio.ensure_future(self._pump_stream(send, last_event_id))
+        disconnected = asyncio.ensure_future(self._wait_for_disconnect(receive))
+        self._streams.add(pump)
+        try:
+            await asyncio.wait({pump, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            self._streams.discard(pump)
+            pump.cancel()
+            disconnected.cancel()
+            await asyncio.gather(pump, disconnected, return_exceptions=True)
+        flask_module.requests_total.inc(route=scope['path'], method='GET', status=200)
+        if disconnected.cancelled():
+            # Closed from our side: finish the response so the client reconnects elsewhere
+            await send({'type': 'http.response.body', 'body': b''})
+
+    async def _pump_stream(self, send, last_event_id):
+        events = flask_module.results_broadcaster.stream_async(last_event_id)
+        try:
+            async for chunk in events:
+                await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+        finally:
+            await events.aclose()
+
+    async def _wait_for_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def positions(self, request):
+        ballot = await flask_module.ballot_index.current_async(self.repo)
+        body = ballot.body(self.dumps)
+        use_gzip = accepts_gzip(request.headers.get('accept-encoding', ''))
+        etag = ballot.etag + ('-gz' if use_gzip else '')
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': f'public, max-age={flask_module.BALLOT_CACHE_MAX_AGE}, must-revalidate',
+            'Vary': 'Accept-Encoding',
+        }
+        if etag_matches(request.headers.get('if-none-match'), etag):
+            return Response(status=304, headers=headers)
+        if use_gzip:
+            headers['Content-Encoding'] = 'gzip'
+            return Response(ballot.gzip_body(self.dumps), headers=headers)
+        return Response(body, headers=headers)
+
+    # Lifecycle
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.repo.open()
+                except Exception as e:
+                    logger.exception('Async storage failed to start')
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                self._watch_exit_signals()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _watch_exit_signals(self):
+        # uvicorn sends lifespan.shutdown only after every connection has closed, and a
+        # results stream never closes by itself: start draining as soon as the exit signal
+        # arrives, then let uvicorn's own handler run
+        if threading.current_thread() is not threading.main_thread():
+            return
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            previous = signal.getsignal(sig)
+            if not callable(previous):
+                continue
+
+            def handler(signum, frame, previous=previous):
+                loop.call_soon_threadsafe(self.begin_shutdown)
+                previous(signum, frame)
+
+            signal.signal(sig, handler)
+
+    def begin_shutdown(self):
+        self.draining = True
+        for stream in list(self._streams):
+            stream.cancel()
+
+    async def shutdown(self):
+        # Stop taking requests, let in-flight ones finish, then flush every accepted vote
+        self.begin_shutdown()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.shutdown_timeout
+        while self.in_flight and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        if self._pending_votes:
+            logger.info('Waiting for %d in-flight vote write(s)', len(self._pending_votes))
+            await asyncio.wait(set(self._pending_votes), timeout=max(0.0, deadline - loop.time()))
+        ingestor = flask_module.vote_ingestor
+        if ingestor is not None:
+            await loop.run_in_executor(None, ingestor.stop, max(1.0, deadline - loop.time()))
+            logger.info('Vote ingest queue drained: %s', ingestor.stats())
+        await self.repo.close()
+
+    def stats(self):
+        return {'in_flight': self.in_flight, 'max_in_flight': self.max_in_flight, 'shed': self.shed,
+                'pending_votes': len(self._pending_votes), 'streams': len(self._streams), 'draining': self.draining}
+
+
+def create_app(async_repo=None, **options):
+    return AsyncVotingApp(async_repo or create_default_repository(), **options)
+
+
+app = create_app()
+
+async_requests_shed = registry.counter('asgi_requests_shed_total', 'Requests refused by the in-flight limit.')
+async_in_flight = registry.gauge('asgi_requests_in_flight', 'Requests on the async routes.')
+async_streams = registry.gauge('asgi_results_streams', 'Open /api/results/stream connections.')
+
+
+@registry.collector
+def collect_async_stats():
+    async_in_flight.set(app.in_flight)
+    async_streams.set(len(app._streams))
+    async_requests_shed.set_total(app.shed)
+    stats = app.repo.pool_stats()
+    if stats is not None:
+        for state in ('open', 'idle', 'in_use', 'waiting'):
+            flask_module.pool_gauge.set(stats[state], state=state, pool='async')
+        flask_module.pool_events.set_total(stats.get('timeouts', 0), event='timeouts', pool='async')
+
+
+if __name__ == '__main__':
+    import uvicorn
+    flask_module.initialize_db()
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)),
+                timeout_graceful_shutdown=int(ASYNC_SHUTDOWN_TIMEOUT), backlog=2048)
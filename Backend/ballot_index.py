@@ -0,0 +1,111 @@
+import asyncio
+import gzip
+import hashlib
+import threading
+import time
+
+from images import image_variants
+from vote_ingest import InvalidBallot
+
+
+class Ballot:
+    # Immutable snapshot of positions and candidates at one ballot version
+    def __init__(self, version, rows):
+        self.version = version
+        self.positions = {}
+        self.candidates = {}
+        self.position_candidates = {}
+        for row in rows:
+            position_id = row['position_id']
+            if position_id not in self.positions:
+                self.positions[position_id] = {
+                    'id': position_id, 'name': row['position_name'], 'category': row['category'], 'candidates': []}
+                self.position_candidates[position_id] = set()
+            if row['candidate_id'] is not None:
+                # Processed uploads are served as their card-size variant; images lists every size
+                variants = image_variants(row['image'])
+                candidate = {'id': row['candidate_id'], 'name': row['candidate_name'],
+                             'image': variants['card']['jpg'] if variants else row['image'],
+                             'images': variants, 'position_id': position_id}
+                self.candidates[candidate['id']] = candidate
+                self.positions[position_id]['candidates'].append(candidate)
+                self.position_candidates[position_id].add(candidate['id'])
+        self._lock = threading.Lock()
+        self._body = None
+        self._gzip_body = None
+        self.etag = None
+
+    def body(self, dumps):
+        # Serialized /api/positions payload, built once per ballot version
+        if self._body is None:
+            with self._lock:
+                if self._body is None:
+                    body = dumps({'positions': list(self.positions.values())}).encode('utf-8')
+                    self.etag = hashlib.sha1(body).hexdigest()
+                    self._body = body
+        return self._body
+
+    def gzip_body(self, dumps):
+        if self._gzip_body is None:
+            body = self.body(dumps)
+            with self._lock:
+                if self._gzip_body is None:
+                    self._gzip_body = gzip.compress(body, mtime=0)
+        return self._gzip_body
+
+    def validate(self, votes):
+        for position_id, candidate_id in votes.items():
+            if position_id not in self.positions:
+                raise InvalidBallot(f'Unknown position {position_id}.')
+            if candidate_id not in self.position_candidates[position_id]:
+                raise InvalidBallot(f'Candidate {candidate_id} is not standing for position {position_id}.')
+
+
+class BallotIndex:
+    # Process-local cache of the ballot. The DB-side version counter is re-read at most
+    # every check_interval seconds, so other workers' admin edits are picked up quickly
+    # while the vote hot path normally issues no lookup queries at all.
+    def __init__(self, repo, check_interval=1.0):
+        self._repo = repo
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._ballot = None
+        self._checked_at = 0.0
+        self._async_lock = None
+
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = 0.0
+
+    def current(self):
+        ballot = self._ballot
+        if ballot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return ballot
+        with self._lock:
+            if self._ballot is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self._ballot
+            version = self._repo.ballot_version()
+            if self._ballot is None or self._ballot.version != version:
+                self._ballot = Ballot(version, self._repo.load_ballot())
+            self._checked_at = time.monotonic()
+            return self._ballot
+
+    async def current_async(self, async_repo):
+        # Same cache, refreshed through an AsyncRepository by the ASGI entry point. Admin
+        # writes served by the Flask app still invalidate it.
+        ballot = self._ballot
+        if ballot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return ballot
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+        async with self._async_lock:
+            if self._ballot is not None and time.monotonic() - self._checked_at < self.check_interval:
+                return self._ballot
+            version = await async_repo.ballot_version()
+            ballot = self._ballot
+            if ballot is None or ballot.version != version:
+                ballot = Ballot(version, await async_repo.load_ballot())
+            with self._lock:
+                self._ballot = ballot
+                self._checked_at = time.monotonic()
+            return ballot
@@ -0,0 +1,250 @@
+"""Compare how the sync (Flask/WSGI) and async (ASGI) servers scale with concurrent clients.
+
+Each server runs in its own subprocess on the in-memory backend. Every storage call sleeps
+for --db-latency-ms while holding one of --pool-size simulated connections, so the run
+measures how each model copes with waiting on the database rather than SQLite's speed.
+The sync server gets a fixed pool of --sync-threads request threads, like a gunicorn
+worker with --threads.
+
+    cd Backend
+    python -m bench.concurrency --levels 8,32,128,256 --duration 10 --output scaling.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.loadtest import BENCH_ENV, DEFAULT_MIX, Worker, parse_mix, request, seed, summarize
+
+MODES = ('sync', 'async')
+
+
+class SlowRepository:
+    # Sync repository proxy: each call holds a simulated connection for the given latency
+    def __init__(self, repo, latency, pool_size, pool_timeout=5.0):
+        self._repo = repo
+        self._latency = latency
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._pool_timeout = pool_timeout
+        self.name = repo.name
+
+    def pool_stats(self):
+        return None
+
+    def __getattr__(self, name):
+        method = getattr(self._repo, name)
+
+        def call(*args, **kwargs):
+            from db_pool import PoolExhausted
+            if not self._slots.acquire(timeout=self._pool_timeout):
+                raise PoolExhausted('No database connection available')
+            try:
+                time.sleep(self._latency)
+                return method(*args, **kwargs)
+            finally:
+                self._slots.release()
+        return call
+
+
+class AsyncSlowRepository:
+    # Async counterpart: waits on the event loop instead of blocking a thread
+    def __init__(self, repo, latency, pool_size, pool_timeout=5.0):
+        self._repo = repo
+        self._latency = latency
+        self._pool_size = pool_size
+        self._pool_timeout = pool_timeout
+        self._slots = None
+        self.name = repo.name
+
+    async def open(self):
+        self._slots = asyncio.Semaphore(self._pool_size)
+
+    async def close(self):
+        pass
+
+    def pool_stats(self):
+        return None
+
+    def __getattr__(self, name):
+        method = getattr(self._repo, name)
+
+        async def call(*args, **kwargs):
+            from db_pool import PoolExhausted
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self._pool_timeout)
+            except asyncio.TimeoutError:
+                raise PoolExhausted('No database connection available')
+            try:
+                await asyncio.sleep(self._latency)
+                return method(*args, **kwargs)
+            finally:
+                self._slots.release()
+        return call
+
+
+def make_bounded_server(host, port, app, threads):
+    from werkzeug.serving import BaseWSGIServer
+
+    class BoundedThreadWSGIServer(BaseWSGIServer):
+        request_queue_size = 2048
+
+        def __init__(self):
+            super().__init__(host, port, app)
+            self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+
+        def process_request(self, request, client_address):
+            self._pool.submit(self._handle, request, client_address)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    return BoundedThreadWSGIServer()
+
+
+def serve(args):
+    os.environ.update(BENCH_ENV, STORAGE_BACKEND='memory', LOG_LEVEL='WARNING', VOTE_INGEST_MODE='sync')
+    import logging
+    import app as app_module
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    memory_repo = app_module.repo
+    seed(memory_repo, args.voters, args.positions, args.candidates)
+    latency = args.db_latency_ms / 1000
+    if args.serve == 'sync':
+        slow = SlowRepository(memory_repo, latency, args.pool_size)
+        app_module.repo = slow
+        app_module.ballot_index._repo = slow
+        make_bounded_server('127.0.0.1', args.port, app_module.app, args.sync_threads).serve_forever()
+    else:
+        import asgi
+        import uvicorn
+        asgi.app = asgi.create_app(AsyncSlowRepository(memory_repo, latency, args.pool_size))
+        uvicorn.run(asgi.app, host='127.0.0.1', port=args.port, log_level='warning', backlog=2048,
+                    timeout_graceful_shutdown=10)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(mode, args):
+    port = free_port()
+    cmd = [sys.executable, '-m', 'bench.concurrency', '--serve', mode, '--port', str(port)]
+    for option in ('voters', 'positions', 'candidates', 'db_latency_ms', 'pool_size', 'sync_threads'):
+        cmd += ['--' + option.replace('_', '-'), str(getattr(args, option))]
+    proc = subprocess.Popen(cmd, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f'{mode} server exited with {proc.returncode}')
+        try:
+            if request(base_url, 'GET', '/api/positions', timeout=2)[0] == 200:
+                return proc, base_url
+        except OSError:
+            pass
+        time.sleep(0.2)
+    proc.kill()
+    raise SystemExit(f'{mode} server did not start')
+
+
+def run_level(base_url, weights, ballot, concurrency, args):
+    results = {op: [] for op in weights}
+    rng = random.Random(args.seed)
+    started = time.monotonic()
+    workers = [Worker(base_url, weights, args.voters, ballot, started + args.duration, results,
+                      random.Random(rng.random())) for _ in range(concurrency)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.monotonic() - started
+    return {
+        'totals': summarize([s for samples in results.values() for s in samples], elapsed),
+        'operations': {op: summarize(samples, elapsed) for op, samples in results.items()},
+    }
+
+
+def run(args):
+    weights = parse_mix(args.mix)
+    levels = [int(n) for n in args.levels.split(',')]
+    report = {'config': {k: v for k, v in vars(args).items() if k not in ('output', 'serve', 'port')},
+              'modes': {}}
+    for mode in args.modes.split(','):
+        proc, base_url = start_server(mode, args)
+        try:
+            body = request(base_url, 'GET', '/api/positions')[1]
+            ballot = {p['id']: [c['id'] for c in p['candidates']] for p in json.loads(body)['positions']
+                      if p['candidates']}
+            report['modes'][mode] = {}
+            for level in levels:
+                report['modes'][mode][str(level)] = run_level(base_url, weights, ballot, level, args)
+                totals = report['modes'][mode][str(level)]['totals']
+                print(f"{mode:>6} c={level:<5} {totals['throughput_rps']:>9} rps  p99 {totals['p99_ms']} ms  "
+                      f"errors {totals['error_rate']:.2%}", file=sys.stderr)
+        finally:
+            proc.terminate()
+            proc.wait(30)
+    return report
+
+
+def print_report(report):
+    modes = list(report['modes'])
+    header = f"{'clients':>8}" + ''.join(f"{m + ' rps':>12}{m + ' p99':>12}{m + ' err%':>11}" for m in modes)
+    print(header)
+    levels = list(report['modes'][modes[0]]) if modes else []
+    for level in levels:
+        line = f'{level:>8}'
+        for m in modes:
+            t = report['modes'][m][level]['totals']
+            line += f"{t['throughput_rps']:>12}{t['p99_ms'] or 0:>12}{t['error_rate'] * 100:>11.2f}"
+        print(line)
+    for m in modes:
+        positions = [report['modes'][m][level]['operations'].get('positions', {}).get('p99_ms') for level in levels]
+        print(f'{m} /api/positions p99 by level (ms): {positions}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--levels', default='8,32,128,256', help='Comma-separated client concurrency levels.')
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per level.')
+    parser.add_argument('--mix', default=DEFAULT_MIX)
+    parser.add_argument('--voters', type=int, default=2000)
+    parser.add_argument('--positions', type=int, default=4)
+    parser.add_argument('--candidates', type=int, default=3)
+    parser.add_argument('--db-latency-ms', type=float, default=10.0, help='Simulated time per storage call.')
+    parser.add_argument('--pool-size', type=int, default=20, help='Simulated DB connections, both modes.')
+    parser.add_argument('--sync-threads', type=int, default=16, help='Request threads for the sync server.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the JSON report here.')
+    parser.add_argument('--serve', choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args)
+        return 0
+    report = run(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
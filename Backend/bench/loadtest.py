@@ -0,0 +1,298 @@
+"""Load-test the voting API and record throughput/latency as JSON.
+
+Offline (default): starts app.py in-process on a local port, backed by a seeded SQLite
+file (or --backend memory). Remote: pass --url to drive an already running server.
+
+    cd Backend
+    python -m bench.loadtest --voters 2000 --concurrency 32 --duration 30 --output run.json
+    python -m bench.loadtest --baseline run.json --threshold 0.10   # exit 1 on regression
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import secrets
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+DEFAULT_MIX = 'login=25,positions=30,vote=25,results=20'
+ROUTES = {
+    'login': '/api/login',
+    'positions': '/api/positions',
+    'vote': '/api/vote',
+    'results': '/api/results',
+}
+
+
+def seed(repo, voters, positions, candidates):
+    repo.initialize()
+    for start in range(0, voters, 1000):
+        repo.insert_users([(f'Voter {i}', voter_email(i), voter_password(i))
+                           for i in range(start, min(start + 1000, voters))])
+    categories = ('students', 'teachers', 'staff')
+    for p in range(positions):
+        position_id = repo.add_position(f'Position {p}', categories[p % len(categories)])
+        for c in range(candidates):
+            repo.add_candidate(f'Candidate {p}.{c}', None, position_id)
+
+
+def voter_email(i):
+    return f'voter{i}@bench.local'
+
+
+def voter_password(i):
+    return f'pw-{i}'
+
+
+# The benchmarks replay many voters from one address, so admission control is switched off.
+# The app refuses to start without a session secret outside its own entry points, and
+# benchmark ballots must never reach the audit log that `flask audit-votes` checks.
+BENCH_ENV = {'ADMISSION_MAX_CONCURRENT': '0', 'RATE_LIMIT_IP_RATE': '0', 'RATE_LIMIT_LOGIN_RATE': '0',
+             'RATE_LIMIT_VOTE_RATE': '0', 'SESSION_SECRET': os.getenv('SESSION_SECRET') or secrets.token_hex(32),
+             'VOTE_LOG': '0'}
+
+
+def start_inprocess_server(backend, db_path, pool_size):
+    # Import the real app with its storage pointed at a scratch backend
+    from werkzeug.serving import make_server
+    os.environ.update(BENCH_ENV, STORAGE_BACKEND=backend, SQLITE_PATH=db_path, DB_POOL_SIZE=str(pool_size))
+    import app as app_module
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return app_module.repo, server, f'http://127.0.0.1:{server.server_port}'
+
+
+def request(base_url, method, path, body=None, timeout=30, headers=None):
+    data = json.dumps(body).encode() if body is not None else None
+    headers = dict(headers or {})
+    if data:
+        headers['Content-Type'] = 'application/json'
+    req = urllib.request.Request(base_url + path, data=data, method=method, headers=headers)
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ROUTES:
+            raise SystemExit(f'Unknown operation in --mix: {name}')
+        weights[name] = float(weight)
+    return weights
+
+
+def scrape_db_queries(base_url):
+    # {route: (sum, count)} of per-request SQL statement counts, from /metrics
+    status, body = request(base_url, 'GET', '/metrics')
+    if status != 200:
+        return {}
+    totals = {}
+    for line in body.decode().splitlines():
+        m = re.match(r'http_request_db_queries_(sum|count)\{method="\w+",route="([^"]+)"\} ([\d.e+-]+)', line)
+        if m:
+            entry = totals.setdefault(m.group(2), [0.0, 0.0])
+            entry[0 if m.group(1) == 'sum' else 1] += float(m.group(3))
+    return totals
+
+
+class Worker(threading.Thread):
+    def __init__(self, base_url, weights, voters, ballot, deadline, results, rng):
+        super().__init__(daemon=True)
+        self.base_url = base_url
+        self.ops = list(weights)
+        self.weights = [weights[o] for o in self.ops]
+        self.voters = voters
+        self.ballot = ballot
+        self.deadline = deadline
+        self.results = results
+        self.rng = rng
+        self.user = None
+        self.token = None
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            op = self.rng.choices(self.ops, self.weights)[0]
+            started = time.perf_counter()
+            try:
+                status = getattr(self, 'do_' + op)()
+                ok = 200 <= status < 300
+            except Exception:
+                ok = False
+            self.results[op].append((time.perf_counter() - started, ok))
+
+    def do_login(self):
+        i = self.rng.randrange(self.voters)
+        status, body = request(self.base_url, 'POST', '/api/login',
+                               {'email': voter_email(i), 'password': voter_password(i)})
+        if status == 200:
+            data = json.loads(body)
+            self.user, self.token = data['user'], data['token']
+        return status
+
+    def do_positions(self):
+        return request(self.base_url, 'GET', '/api/positions')[0]
+
+    def do_results(self):
+        return request(self.base_url, 'GET', '/api/results')[0]
+
+    def do_vote(self):
+        if self.user is None:
+            return self.do_login()
+        votes = {str(pid): self.rng.choice(cids) for pid, cids in self.ballot.items()}
+        return request(self.base_url, 'POST', '/api/vote', {'user_id': self.user['id'], 'votes': votes},
+                       headers={'Authorization': f'Bearer {self.token}'})[0]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(s[0] for s in samples)
+    errors = sum(1 for s in samples if not s[1])
+    return {
+        'requests': len(samples),
+        'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0,
+        'error_rate': round(errors / len(samples), 4) if samples else 0,
+        'p50_ms': _ms(percentile(latencies, 50)),
+        'p95_ms': _ms(percentile(latencies, 95)),
+        'p99_ms': _ms(percentile(latencies, 99)),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+def run(args):
+    weights = parse_mix(args.mix)
+    server = None
+    tmpdir = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        tmpdir = tempfile.mkdtemp(prefix='voting-bench-')
+        repo, server, base_url = start_inprocess_server(args.backend, os.path.join(tmpdir, 'bench.db'), args.pool_size)
+        seed(repo, args.voters, args.positions, args.candidates)
+
+    status, body = request(base_url, 'GET', '/api/positions')
+    if status != 200:
+        raise SystemExit(f'GET /api/positions failed with {status}')
+    ballot = {p['id']: [c['id'] for c in p['candidates']] for p in json.loads(body)['positions'] if p['candidates']}
+
+    queries_before = scrape_db_queries(base_url)
+    results = {op: [] for op in weights}
+    rng = random.Random(args.seed)
+    started = time.monotonic()
+    workers = [Worker(base_url, weights, args.voters, ballot, started + args.duration, results,
+                      random.Random(rng.random())) for _ in range(args.concurrency)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.monotonic() - started
+    queries_after = scrape_db_queries(base_url)
+    drift = None
+    if server is not None:
+        server.shutdown()
+        # Sanity check that the incrementally maintained tallies still match the votes
+        drift = len(repo.tally_drift())
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    queries_per_request = {}
+    for op, route in ROUTES.items():
+        before = queries_before.get(route, [0, 0])
+        after = queries_after.get(route)
+        if after and after[1] > before[1]:
+            queries_per_request[op] = round((after[0] - before[0]) / (after[1] - before[1]), 2)
+
+    report = {
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')},
+        'target': args.url or f'in-process ({args.backend})',
+        'elapsed_seconds': round(elapsed, 3),
+        'totals': summarize([s for samples in results.values() for s in samples], elapsed),
+        'operations': {op: summarize(samples, elapsed) for op, samples in results.items()},
+        'queries_per_request': queries_per_request,
+        'tally_drift_rows': drift,
+    }
+    return report
+
+
+def compare(report, baseline, threshold):
+    # Flags throughput drops and tail-latency growth beyond the threshold (0.10 = 10%)
+    regressions = []
+    for scope, current, previous in [('totals', report['totals'], baseline['totals'])] + [
+            (op, report['operations'][op], baseline['operations'][op])
+            for op in report['operations'] if op in baseline.get('operations', {})]:
+        if previous['throughput_rps'] and current['throughput_rps'] < previous['throughput_rps'] * (1 - threshold):
+            regressions.append(f"{scope}: throughput {previous['throughput_rps']} -> {current['throughput_rps']} rps")
+        for key in ('p95_ms', 'p99_ms'):
+            if previous[key] and current[key] and current[key] > previous[key] * (1 + threshold):
+                regressions.append(f'{scope}: {key} {previous[key]} -> {current[key]}')
+        if current['error_rate'] > previous['error_rate'] + threshold / 10:
+            regressions.append(f"{scope}: error rate {previous['error_rate']} -> {current['error_rate']}")
+    return regressions
+
+
+def print_report(report):
+    print(f"{'operation':<12}{'requests':>10}{'rps':>10}{'err%':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'q/req':>8}")
+    rows = list(report['operations'].items()) + [('TOTAL', report['totals'])]
+    for op, s in rows:
+        print(f"{op:<12}{s['requests']:>10}{s['throughput_rps']:>10}{s['error_rate'] * 100:>8.2f}"
+              f"{s['p50_ms'] or 0:>10}{s['p95_ms'] or 0:>10}{s['p99_ms'] or 0:>10}"
+              f"{report['queries_per_request'].get(op, ''):>8}")
+    if report['tally_drift_rows']:
+        print(f"WARNING: {report['tally_drift_rows']} tally row(s) disagree with the votes table")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Benchmark a running server instead of starting one in-process.')
+    parser.add_argument('--backend', choices=('sqlite', 'memory'), default='sqlite',
+                        help='Storage backend for the in-process server.')
+    parser.add_argument('--voters', type=int, default=1000)
+    parser.add_argument('--positions', type=int, default=4)
+    parser.add_argument('--candidates', type=int, default=3, help='Candidates per position.')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds to run.')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Weighted operation mix, e.g. %s' % DEFAULT_MIX)
+    parser.add_argument('--pool-size', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Write the JSON report here.')
+    parser.add_argument('--baseline', help='Compare against a previous JSON report.')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Allowed regression ratio.')
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        for line in regressions:
+            print('REGRESSION', line)
+        if regressions:
+            return 1
+        print(f'No regressions beyond {args.threshold:.0%}.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+SCHEME = 'scrypt'
+SCRYPT_N = 2 ** 14
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+KEY_BYTES = 32  # scrypt$n$r$p$salt$key stays under the 100-character password column
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def _b64encode(data):
+    return base64.b64encode(data).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def _scrypt(password, salt, n, r, p, dklen):
+    return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p, dklen=dklen,
+                          maxmem=128 * r * (n + p + 2) + (1 << 20))
+
+
+def is_hashed(stored):
+    return isinstance(stored, str) and stored.startswith(SCHEME + '$')
+
+
+def hash_password(password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    salt = os.urandom(SALT_BYTES)
+    key = _scrypt(password, salt, n, r, p, KEY_BYTES)
+    return f'{SCHEME}${n}${r}${p}${_b64encode(salt)}${_b64encode(key)}'
+
+
+def verify_password(stored, password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    # Returns (matches, new_hash). new_hash is set when the stored value should be replaced:
+    # rows that predate hashing hold the plaintext, and older hashes may use weaker parameters.
+    if not isinstance(stored, str) or not isinstance(password, str):
+        return False, None
+    if not is_hashed(stored):
+        if hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8')):
+            return True, hash_password(password, n, r, p)
+        return False, None
+    try:
+        _, stored_n, stored_r, stored_p, salt, key = stored.split('$')
+        params = int(stored_n), int(stored_r), int(stored_p)
+        salt, key = _b64decode(salt), _b64decode(key)
+    except ValueError:
+        return False, None
+    if not hmac.compare_digest(_scrypt(password, salt, *params, len(key)), key):
+        return False, None
+    return True, (hash_password(password, n, r, p) if params != (n, r, p) else None)
+
+
+class PasswordHasher:
+    # Runs scrypt on a bounded worker pool so request threads only wait, never burn CPU.
+    # hashlib.scrypt releases the GIL, so threads hash in parallel; executor='process'
+    # moves the work out of the server process entirely. At most max_pending calls may be
+    # queued or running: past that, login fails fast with HasherBusy (503) instead of
+    # building an unbounded backlog at polls-open.
+    def __init__(self, workers=None, executor='thread', max_pending=None,
+                 n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+        if executor not in ('thread', 'process'):
+            raise ValueError(f'Unsupported executor: {executor}')
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = executor
+        self.max_pending = max_pending or self.workers * 16
+        self.params = (n, r, p)
+        if executor == 'process':
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password')
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.rejected = 0
+        self.completed = 0
+
+    def _submit(self, fn, *args, block=False):
+        if not self._slots.acquire(blocking=block):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy('Too many logins in progress')
+        with self._lock:
+            self.pending += 1
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._done(None)
+            raise
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future):
+        with self._lock:
+            self.pending -= 1
+            if future is not None:
+                self.completed += 1
+        self._slots.release()
+
+    def hash(self, password):
+        return self._submit(hash_password, password, *self.params).result()
+
+    def verify(self, stored, password):
+        return self._submit(verify_password, stored, password, *self.params).result()
+
+    async def hash_async(self, password):
+        return await asyncio.wrap_future(self._submit(hash_password, password, *self.params))
+
+    async def verify_async(self, stored, password):
+        return await asyncio.wrap_future(self._submit(verify_password, stored, password, *self.params))
+
+    def hash_many(self, passwords):
+        # For bulk imports: waits for pool capacity instead of failing, one wave at a time
+        # so queued logins are never stuck behind a whole import chunk
+        hashes = []
+        for start in range(0, len(passwords), self.workers):
+            futures = [self._submit(hash_password, password, *self.params, block=True)
+                       for password in passwords[start:start + self.workers]]
+            hashes.extend(f.result() for f in futures)
+        return hashes
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'executor': self.executor, 'max_pending': self.max_pending,
+                    'pending': self.pending, 'completed': self.completed, 'rejected': self.rejected}
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
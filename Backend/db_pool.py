@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class PooledConnection:
+    # Thin wrapper around a real connection; close() hands it back to the pool
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self._checked_out = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def cursor(self, *args, **kwargs):
+        cursor = self._conn.cursor(*args, **kwargs)
+        if self._pool.wrap_cursor is not None:
+            cursor = self._pool.wrap_cursor(cursor)
+        return cursor
+
+    def close(self):
+        if self._checked_out:
+            self._checked_out = False
+            self._pool.release(self)
+
+
+class ConnectionPool:
+    def __init__(self, connect, size=10, timeout=5.0, recycle=1800, ping_interval=30.0, wrap_cursor=None):
+        self._connect = connect
+        self.wrap_cursor = wrap_cursor
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_interval = ping_interval
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        # Connections must never be shared across a fork (e.g. gunicorn workers)
+        self._pid = os.getpid()
+        self._idle = []
+        self._open = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.created = 0
+        self.recycled = 0
+        self.timeouts = 0
+
+    def acquire(self):
+        with self._cond:
+            if self._pid != os.getpid():
+                self._reset()
+            deadline = time.monotonic() + self.timeout
+            self.waiting += 1
+            try:
+                while not self._idle and self._open >= self.size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolExhausted('No database connection available within %.1fs' % self.timeout)
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._open += 1
+            self.in_use += 1
+        try:
+            conn = self._prepare(conn)
+        except Exception:
+            with self._cond:
+                self._open -= 1
+                self.in_use -= 1
+                self._cond.notify()
+            raise
+        conn._checked_out = True
+        conn.last_used = time.monotonic()
+        return conn
+
+    def _prepare(self, conn):
+        # Connects and pings outside the lock; only the counters are updated under it
+        now = time.monotonic()
+        if conn is not None and now - conn.created_at > self.recycle:
+            self._discard(conn)
+            conn = None
+            with self._cond:
+                self.recycled += 1
+        elif conn is not None and now - conn.last_used > self.ping_interval:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                self._discard(conn)
+                conn = None
+                with self._cond:
+                    self.recycled += 1
+        if conn is None:
+            conn = PooledConnection(self, self._connect())
+            with self._cond:
+                self.created += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn._conn.close()
+        except Exception:
+            pass
+
+    def release(self, conn):
+        healthy = True
+        try:
+            # Never hand out a connection with a half-finished transaction or unread rows
+            if conn.unread_result:
+                conn.consume_results()
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            healthy = False
+            self._discard(conn)
+        with self._cond:
+            if conn._pool is not self or self._pid != os.getpid():
+                return
+            self.in_use -= 1
+            if healthy:
+                conn.last_used = time.monotonic()
+                self._idle.append(conn)
+            else:
+                self._open -= 1
+                self.recycled += 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self.in_use,
+                'waiting': self.waiting,
+                'created': self.created,
+                'recycled': self.recycled,
+                'timeouts': self.timeouts,
+            }
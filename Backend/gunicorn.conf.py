@@ -0,0 +1,38 @@
+"""Production server: gunicorn with gevent workers.
+
+Requests run as greenlets, so an open /api/results/stream connection costs a greenlet
+rather than an OS thread and one worker holds up to worker_connections SSE clients.
+gunicorn picks this file up from the working directory:
+
+    cd Backend
+    gunicorn app:app
+    GUNICORN_WORKERS=4 PORT=8000 gunicorn app:app
+
+`python app.py` is the single-process development server, with one thread per request
+(and so per open stream). Every worker must be given the same SESSION_SECRET. Pending
+schema migrations are applied once, before any worker starts.
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gevent'
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# gevent turns threads into greenlets on the worker's single OS thread, where CPU-bound
+# scrypt or image resizing would stall every open request; run them in child processes
+os.environ.setdefault('PASSWORD_HASH_EXECUTOR', 'process')
+os.environ.setdefault('IMAGE_EXECUTOR', 'process')
+
+
+def on_starting(server):
+    # `flask migrate` in a child process: importing the app here would start its background
+    # threads in the master, and the forked workers would inherit the module without them.
+    # Cheap when the schema is current; a failed migration stops gunicorn.
+    server.log.info('Applying schema migrations')
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'migrate'],
+                   cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
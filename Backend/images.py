@@ -0,0 +1,209 @@
+import hashlib
+import io
+import logging
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger('voting.images')
+
+MAX_IMAGE_BYTES = 10 * 1024 * 1024
+MAX_IMAGE_PIXELS = 40_000_000  # refuse decompression bombs before decoding
+SOURCE_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+# name -> longest edge in pixels. The size is part of the filename, so changing it
+# produces new files instead of invalidating ones browsers have cached forever.
+VARIANTS = (('thumb', 96), ('card', 320))
+OUTPUT_FORMATS = (('webp', 'WEBP', {'quality': 80, 'method': 4}),
+                  ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}))
+URL_PREFIX = '/uploads/'
+DIGEST_LENGTH = 32
+
+_CONTENT_NAME = re.compile(r'^([0-9a-f]{%d})(?:-[a-z]+\d+)?\.(?:jpg|png|gif|webp)$' % DIGEST_LENGTH)
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()[:DIGEST_LENGTH]
+
+
+def is_content_addressed(filename):
+    # Content-hash names never change meaning, so they can be cached as immutable
+    return _CONTENT_NAME.match(filename) is not None
+
+
+def image_digest(url):
+    # The digest of an uploaded original, or None for external URLs and legacy uploads
+    if not url or not url.startswith(URL_PREFIX):
+        return None
+    match = _CONTENT_NAME.match(url[len(URL_PREFIX):])
+    return match.group(1) if match and '-' not in url[len(URL_PREFIX):] else None
+
+
+def variant_filename(digest, variant, size, ext):
+    return f'{digest}-{variant}{size}.{ext}'
+
+
+def image_variants(url):
+    # {variant: {ext: url}} for a pipeline-processed image, else None
+    digest = image_digest(url)
+    if digest is None:
+        return None
+    return {variant: {ext: URL_PREFIX + variant_filename(digest, variant, size, ext)
+                      for ext, _, _ in OUTPUT_FORMATS}
+            for variant, size in VARIANTS}
+
+
+def inspect_image(data, max_bytes=MAX_IMAGE_BYTES, max_pixels=MAX_IMAGE_PIXELS):
+    # Cheap validation on the request thread; returns the extension for the original
+    if not data:
+        raise InvalidImage('Empty image file.')
+    if len(data) > max_bytes:
+        raise InvalidImage(f'Image is larger than {max_bytes // (1024 * 1024)} MB.')
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.format not in SOURCE_FORMATS:
+                raise InvalidImage('Unsupported image format.')
+            if image.width * image.height > max_pixels:
+                raise InvalidImage('Image dimensions are too large.')
+            image.verify()
+            return SOURCE_FORMATS[image.format]
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        raise InvalidImage(f'Not a valid image: {e}')
+
+
+def _write_atomic(path, data):
+    tmp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def render_variants(folder, digest, data):
+    # Writes every variant that is not already on disk; returns the filenames
+    with Image.open(io.BytesIO(data)) as source:
+        source.seek(0)  # first frame of animated GIF/WebP
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    written = []
+    for variant, size in VARIANTS:
+        resized = image.copy()
+        resized.thumbnail((size, size), Image.LANCZOS)
+        flat = None
+        for ext, fmt, options in OUTPUT_FORMATS:
+            filename = variant_filename(digest, variant, size, ext)
+            path = os.path.join(folder, filename)
+            if os.path.exists(path):
+                continue
+            out = resized
+            if fmt == 'JPEG' and resized.mode != 'RGB':
+                if flat is None:
+                    flat = Image.new('RGB', resized.size, (255, 255, 255))
+                    flat.paste(resized, mask=resized.getchannel('A'))
+                out = flat
+            buf = io.BytesIO()
+            out.save(buf, fmt, **options)
+            _write_atomic(path, buf.getvalue())
+            written.append(filename)
+    return written
+
+
+def remove_image_files(folder, digest):
+    removed = 0
+    for filename in os.listdir(folder):
+        if filename.startswith(digest) and is_content_addressed(filename):
+            try:
+                os.remove(os.path.join(folder, filename))
+                removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+class ImagePipeline:
+    # Stores uploads under content-hash names and renders the variants on a small worker
+    # pool. on_ready(candidate_id, url) runs on the worker once every variant is on disk;
+    # if a newer upload or a removal for that candidate superseded the job, on_discard(url)
+    # runs instead so the orphaned files can be collected. executor='process' decodes and
+    # resizes in child processes, for servers (gevent) where a worker thread would run on
+    # the event loop; the callbacks always run in this process.
+    def __init__(self, folder, on_ready, on_discard=None, workers=2, max_bytes=MAX_IMAGE_BYTES,
+                 executor='thread'):
+        if executor not in ('thread', 'process'):
+            raise ValueError(f'Unsupported executor: {executor}')
+        self.folder = folder
+        self.on_ready = on_ready
+        self.on_discard = on_discard
+        self.max_bytes = max_bytes
+        self.executor = executor
+        if executor == 'process':
+            self._executor = ProcessPoolExecutor(max_workers=workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='images')
+        self._lock = threading.RLock()  # held across on_ready so cancel() cannot interleave
+        self._pending = {}  # candidate_id -> digest of the latest upload
+        self.processed = 0
+        self.failed = 0
+
+    def store(self, data):
+        # Validates and saves the original; returns its URL
+        ext = inspect_image(data, self.max_bytes)
+        digest = content_digest(data)
+        path = os.path.join(self.folder, f'{digest}.{ext}')
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+        return digest, URL_PREFIX + f'{digest}.{ext}'
+
+    def process(self, data):
+        # Synchronous store + render, for the CLI
+        digest, url = self.store(data)
+        render_variants(self.folder, digest, data)
+        return url
+
+    def submit(self, candidate_id, data):
+        digest, url = self.store(data)
+        with self._lock:
+            self._pending[candidate_id] = digest
+        future = self._executor.submit(render_variants, self.folder, digest, data)
+        future.add_done_callback(partial(self._finish, candidate_id, digest, url))
+        return url
+
+    def cancel(self, candidate_id):
+        with self._lock:
+            self._pending.pop(candidate_id, None)
+
+    def is_pending(self, digest):
+        with self._lock:
+            return digest in self._pending.values()
+
+    def _finish(self, candidate_id, digest, url, future):
+        try:
+            future.result()
+            with self._lock:
+                current = self._pending.get(candidate_id) == digest
+                if current:
+                    self.on_ready(candidate_id, url)
+                    self.processed += 1
+            if not current and self.on_discard is not None:
+                self.on_discard(url)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            logger.exception('Processing image %s for candidate %s failed', digest, candidate_id)
+        finally:
+            with self._lock:
+                if self._pending.get(candidate_id) == digest:
+                    del self._pending[candidate_id]
+
+    def stats(self):
+        with self._lock:
+            return {'pending': len(self._pending), 'processed': self.processed, 'failed': self.failed}
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
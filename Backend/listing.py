@@ -0,0 +1,31 @@
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+class BadListingRequest(Exception):
+    pass
+
+
+def parse_page_args(args):
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+        after = int(args.get('after', 0))
+    except ValueError:
+        raise BadListingRequest('limit and after must be integers.')
+    if limit < 1:
+        raise BadListingRequest('limit must be positive.')
+    return min(limit, MAX_PAGE_SIZE), after
+
+
+def parse_fields(args, allowed, default):
+    # Column projection; only whitelisted columns can ever be selected
+    fields = args.get('fields')
+    if not fields:
+        return list(default)
+    fields = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise BadListingRequest(f"Unknown field(s): {', '.join(unknown)}.")
+    if 'id' not in fields:
+        fields.insert(0, 'id')  # needed for the cursor
+    return fields
@@ -0,0 +1,203 @@
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger('voting.rate_limit')
+
+
+class Throttled(Exception):
+    # 429 for a client over its own limit, 503 when the server as a whole is shedding load
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self):
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+def _refill(tokens, updated, now, rate, burst, cost):
+    # Returns (tokens left, seconds to wait); wait is 0 when the request is allowed
+    tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / rate
+
+
+class LocalBucketStore:
+    # Token buckets for this process only. Bounded: idle buckets refill to full and are
+    # dropped oldest-first once maxsize keys are tracked.
+    name = 'local'
+
+    def __init__(self, maxsize=100000, clock=time.monotonic):
+        self.maxsize = maxsize
+        self._clock = clock
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1):
+        with self._lock:
+            now = self._clock()
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens, wait = _refill(tokens, updated, now, rate, burst, cost)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def size(self):
+        with self._lock:
+            return len(self._buckets)
+
+
+class SQLiteBucketStore:
+    # Token buckets in a SQLite file, so every gunicorn worker on the host draws from the
+    # same buckets. Each take is one short IMMEDIATE transaction; if the file is locked
+    # for longer than busy_timeout the request is let through rather than failed.
+    # One connection per process, used under the lock: under gevent a thread-local would
+    # be greenlet-local and open a connection per request.
+    name = 'sqlite'
+
+    def __init__(self, path, busy_timeout=0.25, prune_every=1000, idle_seconds=3600, clock=time.time):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.prune_every = prune_every
+        self.idle_seconds = idle_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._takes = 0
+        self.errors = 0
+        with self._lock:
+            self._connection().execute(
+                'CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                               check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=OFF')  # limiter state is disposable
+        return conn
+
+    def _connection(self):
+        # Called with the lock held. A connection must not cross a fork, so a worker forked
+        # after the app was imported opens its own.
+        if self._pid != os.getpid():
+            self._conn = self._connect()
+            self._pid = os.getpid()
+        return self._conn
+
+    def take(self, key, rate, burst, cost=1):
+        with self._lock:
+            self._takes += 1
+            prune = self._takes % self.prune_every == 0
+            return self._take(self._connection(), key, rate, burst, cost, prune)
+
+    def _take(self, conn, key, rate, burst, cost, prune):
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                now = self._clock()
+                row = conn.execute('SELECT tokens, updated FROM buckets WHERE key=?', (key,)).fetchone()
+                tokens, wait = _refill(*(row or (burst, now)), now, rate, burst, cost)
+                conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                             (key, tokens, now))
+                if prune:
+                    conn.execute('DELETE FROM buckets WHERE updated < ?', (now - self.idle_seconds,))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.warning('Rate limit store unavailable, allowing request: %s', e)
+            return 0.0
+        return wait
+
+    def size(self):
+        with self._lock:
+            return self._connection().execute('SELECT COUNT(*) FROM buckets').fetchone()[0]
+
+
+class ConcurrencyLimit:
+    def __init__(self, limit):
+        self.limit = limit
+        self.active = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.active >= self.limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+
+class AdmissionControl:
+    # Front door for the routes that cost DB round trips. Checks run cheapest first:
+    # the global in-flight limit (sheds with 503 before the DB pool is exhausted), then
+    # a per-IP bucket, then a per-subject bucket (email for login, voter id for vote)
+    # once the route has parsed its request. limits maps a bucket name to (rate, burst);
+    # rate is tokens per second and 0 disables that bucket.
+    def __init__(self, store, max_concurrent=0, limits=None):
+        self.store = store
+        self.concurrency = ConcurrencyLimit(max_concurrent) if max_concurrent > 0 else None
+        self.limits = {name: limit for name, limit in (limits or {}).items() if limit[0] > 0}
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.rejected = {}  # (limit, route) -> count
+
+    def _reject(self, limit, route, message, status, retry_after):
+        with self._lock:
+            self.rejected[limit, route] = self.rejected.get((limit, route), 0) + 1
+        raise Throttled(message, status, retry_after)
+
+    def _check(self, limit, route, key):
+        if limit not in self.limits or key in (None, ''):
+            return
+        rate, burst = self.limits[limit]
+        wait = self.store.take(f'{limit}:{key}', rate, burst)
+        if wait > 0:
+            self._reject(limit, route, 'Too many requests, please slow down.', 429, wait)
+
+    @contextmanager
+    def admit(self, route, ip):
+        if self.concurrency is not None and not self.concurrency.try_acquire():
+            self._reject('concurrency', route, 'Server is busy, please try again.', 503, 1)
+        try:
+            self._check('ip', route, ip)
+            with self._lock:
+                self.admitted += 1
+            yield
+        finally:
+            if self.concurrency is not None:
+                self.concurrency.release()
+
+    def check_subject(self, route, subject):
+        self._check(route, route, str(subject).strip().lower() if subject is not None else None)
+
+    def stats(self):
+        with self._lock:
+            rejected = dict(self.rejected)
+            admitted = self.admitted
+        return {
+            'store': self.store.name,
+            'admitted': admitted,
+            'in_flight': self.concurrency.active if self.concurrency else None,
+            'max_concurrent': self.concurrency.limit if self.concurrency else None,
+            'limits': {name: {'rate': rate, 'burst': burst} for name, (rate, burst) in self.limits.items()},
+            'rejected': [{'limit': limit, 'route': route, 'count': count}
+                         for (limit, route), count in sorted(rejected.items())],
+        }
@@ -0,0 +1,197 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+def _key(row):
+    return (row['position_id'], row['candidate_id'])
+
+
+class ResultsBroadcaster:
+    # A single producer thread polls the results at a fixed cadence and publishes
+    # snapshot/diff events; every subscriber reads from the same shared event log,
+    # so database work does not grow with the number of connected viewers.
+    def __init__(self, load_results, interval=1.0, heartbeat=15.0, history=512):
+        self._load_results = load_results
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self._cond = threading.Condition()
+        self._events = deque(maxlen=history)
+        self._rows = None
+        self._event_id = 0
+        self._epoch = None
+        self._thread = None
+        self._listeners = set()  # callbacks run on every publish, for asyncio subscribers
+        self.subscribers = 0
+        self.published = 0
+
+    def _ensure_producer(self):
+        if self._thread is None or not self._thread.is_alive():
+            # Event ids are only meaningful within one producer run of one process;
+            # a new epoch makes resuming clients fall back to a fresh snapshot
+            self._epoch = os.urandom(4).hex()
+            self._events.clear()
+            self._rows = None
+            self._thread = threading.Thread(target=self._run, name='results-broadcaster', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self.subscribers == 0:
+                    self._thread = None
+                    return
+            try:
+                self._publish(self._load_results())
+            except Exception as e:
+                logger.exception('Results broadcaster error: %s', e)
+            time.sleep(self.interval)
+
+    def _publish(self, rows):
+        current = {_key(r): r for r in rows}
+        with self._cond:
+            previous = self._rows
+            self._rows = current
+            if previous is not None:
+                changed = [r for k, r in current.items() if previous.get(k) != r]
+                removed = [list(k) for k in previous if k not in current]
+                if not changed and not removed:
+                    return
+                self._events.append((self._event_id + 1, {'changed': changed, 'removed': removed}))
+                self.published += 1
+            self._event_id += 1
+            self._cond.notify_all()
+            listeners = list(self._listeners)
+        for listener in listeners:
+            listener()
+
+    def subscribe(self, listener=None):
+        with self._cond:
+            self.subscribers += 1
+            if listener is not None:
+                self._listeners.add(listener)
+            self._ensure_producer()
+
+    def unsubscribe(self, listener=None):
+        with self._cond:
+            self.subscribers -= 1
+            self._listeners.discard(listener)
+
+    def _snapshot(self):
+        with self._cond:
+            if self._rows is None:
+                return None
+            return self._event_id, list(self._rows.values())
+
+    def _diffs_since(self, last_id):
+        # Returns the diffs after last_id, or None if they have fallen out of the history
+        with self._cond:
+            if last_id is None:
+                return None
+            if last_id == self._event_id:
+                return []
+            if last_id > self._event_id or not self._events or self._events[0][0] > last_id + 1:
+                return None
+            return [e for e in self._events if e[0] > last_id]
+
+    def _stream_events(self, last_event_id):
+        # The SSE text for one client. Yields an int n instead when the client is up to date:
+        # the caller then waits until an event after n is published or the heartbeat passes.
+        yield 'retry: 3000\n\n'
+        epoch = self._epoch
+        last_id = None
+        resume_id = self._parse_event_id(last_event_id)
+        diffs = self._diffs_since(resume_id)
+        if diffs is not None:
+            for event_id, diff in diffs:
+                yield _format(epoch, event_id, 'diff', diff)
+            last_id = diffs[-1][0] if diffs else resume_id
+        if last_id is None:
+            snapshot = self._snapshot()
+            if snapshot is None:
+                # The producer has not polled yet
+                yield self._event_id
+                snapshot = self._snapshot()
+                if snapshot is None:
+                    return
+            last_id = snapshot[0]
+            yield _format(epoch, last_id, 'snapshot', {'results': snapshot[1]})
+        while True:
+            yield last_id
+            diffs = self._diffs_since(last_id) if epoch == self._epoch else None
+            if diffs is None:
+                # Fell too far behind (or the producer restarted); start over from a snapshot
+                epoch = self._epoch
+                snapshot = self._snapshot()
+                if snapshot is None:
+                    return
+                last_id = snapshot[0]
+                yield _format(epoch, last_id, 'snapshot', {'results': snapshot[1]})
+            elif diffs:
+                for event_id, diff in diffs:
+                    yield _format(epoch, event_id, 'diff', diff)
+                last_id = diffs[-1][0]
+            else:
+                yield ': keepalive\n\n'
+
+    def stream(self, last_event_id=None):
+        # For WSGI servers: the waits block the calling thread (a greenlet under gevent)
+        self.subscribe()
+        try:
+            for item in self._stream_events(last_event_id):
+                if isinstance(item, str):
+                    yield item
+                    continue
+                with self._cond:
+                    self._cond.wait_for(lambda: self._event_id > item, timeout=self.heartbeat)
+        finally:
+            self.unsubscribe()
+
+    async def stream_async(self, last_event_id=None):
+        # For asyncio servers: the producer thread wakes the stream through the event loop,
+        # so an open stream holds no thread
+        loop = asyncio.get_running_loop()
+        wakeup = asyncio.Event()
+
+        def listener():
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                pass  # loop already closed
+
+        self.subscribe(listener)
+        try:
+            for item in self._stream_events(last_event_id):
+                if isinstance(item, str):
+                    yield item
+                    continue
+                wakeup.clear()
+                if self._event_id > item:
+                    continue
+                try:
+                    await asyncio.wait_for(wakeup.wait(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self.unsubscribe(listener)
+
+    def _parse_event_id(self, last_event_id):
+        # Last-Event-ID is '<epoch>:<n>'; ids from another process or producer run are ignored
+        epoch, _, event_id = (last_event_id or '').partition(':')
+        if epoch != self._epoch or not event_id.isdigit():
+            return None
+        return int(event_id)
+
+    def stats(self):
+        with self._cond:
+            return {'subscribers': self.subscribers, 'event_id': self._event_id, 'published': self.published}
+
+
+def _format(epoch, event_id, event, data):
+    return f'id: {epoch}:{event_id}\nevent: {event}\ndata: {json.dumps(data, default=str)}\n\n'
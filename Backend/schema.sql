@@ -1,10 +1,14 @@
+-- Reference copy of the MySQL schema at migration 5. The app creates and upgrades the
+-- database itself through storage/migrations.py (`flask migrate`); do not apply this by hand.
+
 -- Users table
 CREATE TABLE users (
     id INT AUTO_INCREMENT PRIMARY KEY,
     name VARCHAR(100),
     email VARCHAR(100) UNIQUE,
-    password VARCHAR(100),
-    has_voted BOOLEAN DEFAULT 0
+    password VARCHAR(255),
+    has_voted BOOLEAN DEFAULT 0,
+    INDEX idx_users_has_voted (has_voted)
 );
 
 -- Positions table
@@ -29,8 +33,32 @@ CREATE TABLE votes (
     user_id INT,
     position_id INT,
     candidate_id INT,
+    voted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id),
     FOREIGN KEY (position_id) REFERENCES positions(id),
     FOREIGN KEY (candidate_id) REFERENCES candidates(id),
-    UNIQUE KEY unique_vote (user_id, position_id)
-); 
+    UNIQUE KEY unique_vote (user_id, position_id),
+    INDEX idx_votes_position_candidate (position_id, candidate_id)
+);
+
+-- Bumped by every position/candidate write so workers know to reload the ballot
+CREATE TABLE ballot_version (
+    id INT PRIMARY KEY,
+    version INT NOT NULL DEFAULT 0
+);
+INSERT INTO ballot_version (id, version) VALUES (1, 0);
+
+-- Running vote counts, kept in step with votes in the same transaction
+CREATE TABLE tallies (
+    position_id INT NOT NULL,
+    candidate_id INT NOT NULL,
+    count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (position_id, candidate_id)
+);
+
+-- Applied migrations
+CREATE TABLE schema_migrations (
+    version INT PRIMARY KEY,
+    description VARCHAR(255),
+    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
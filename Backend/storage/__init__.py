@@ -0,0 +1,27 @@
+from storage.base import (Repository, RepositoryError, DuplicateEmail, UserHasVoted, IntegrityViolation,
+                          USER_COLUMNS, CANDIDATE_COLUMNS)
+
+BACKENDS = ('mysql', 'sqlite', 'memory')
+
+
+def create_repository(backend, **options):
+    # Backends are imported lazily so e.g. the memory backend works without a MySQL driver
+    if backend == 'mysql':
+        from storage.mysql import MySQLRepository
+        return MySQLRepository(**options)
+    if backend == 'sqlite':
+        from storage.sqlite import SQLiteRepository
+        return SQLiteRepository(**options)
+    if backend == 'memory':
+        from storage.memory import InMemoryRepository
+        return InMemoryRepository()
+    raise ValueError(f'Unknown storage backend: {backend}')
+
+
+def create_async_repository(backend, repo=None, **options):
+    # mysql gets a native asyncio pool; other backends run the sync repository on threads
+    if backend == 'mysql':
+        from storage.mysql_async import AsyncMySQLRepository
+        return AsyncMySQLRepository(**options)
+    from storage.aio import ThreadedAsyncRepository
+    return ThreadedAsyncRepository(repo or create_repository(backend), max_workers=options.get('pool_size', 10))
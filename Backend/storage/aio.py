@@ -0,0 +1,192 @@
+import asyncio
+import contextvars
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from db_pool import PoolExhausted
+from observability import record_query
+from storage.base import DuplicateEmail, IntegrityViolation
+from storage.sql import (BALLOT_QUERY, BALLOT_VERSION_QUERY, INSERT_USER, RESULTS_QUERY, USER_BY_EMAIL_QUERY,
+                         collapse_ballots)
+
+
+class AsyncRepository:
+    # The subset of Repository used by the ASGI entry point's hot routes, as coroutines.
+    # Semantics match the sync methods of the same name.
+    name = 'abstract'
+
+    async def open(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def pool_stats(self):
+        return None
+
+    async def get_user_by_email(self, email):
+        raise NotImplementedError
+
+    async def create_user(self, name, email, password):
+        raise NotImplementedError
+
+    async def set_password(self, user_id, password):
+        raise NotImplementedError
+
+    async def record_ballots(self, ballots):
+        raise NotImplementedError
+
+    async def results(self):
+        raise NotImplementedError
+
+    async def ballot_version(self):
+        raise NotImplementedError
+
+    async def load_ballot(self):
+        raise NotImplementedError
+
+
+class ThreadedAsyncRepository(AsyncRepository):
+    # Runs a sync repository's calls on a bounded thread pool, for backends without an
+    # async driver (sqlite, memory). Request accounting contextvars follow the call; the
+    # wrapped repository's own pool is already reported by the sync app.
+    def __init__(self, repo, max_workers=10):
+        self.repo = repo
+        self.name = repo.name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='storage')
+
+    async def close(self):
+        self._executor.shutdown(wait=True)
+
+    def _call(self, method, *args):
+        context = contextvars.copy_context()
+        return asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(context.run, getattr(self.repo, method), *args))
+
+    async def get_user_by_email(self, email):
+        return await self._call('get_user_by_email', email)
+
+    async def create_user(self, name, email, password):
+        return await self._call('create_user', name, email, password)
+
+    async def set_password(self, user_id, password):
+        return await self._call('set_password', user_id, password)
+
+    async def record_ballots(self, ballots):
+        return await self._call('record_ballots', ballots)
+
+    async def results(self):
+        return await self._call('results')
+
+    async def ballot_version(self):
+        return await self._call('ballot_version')
+
+    async def load_ballot(self):
+        return await self._call('load_ballot')
+
+
+class AsyncSQLRepository(AsyncRepository):
+    # Shared implementation for asyncio DB-API-style drivers; subclasses provide the pool
+    # (open/close/_acquire/_release) and mix in the dialect the sync backend uses.
+    integrity_errors = ()
+
+    def __init__(self, pool_timeout=5.0):
+        self.pool_timeout = pool_timeout
+        self.waiting = 0
+        self.timeouts = 0
+
+    async def _acquire(self):
+        raise NotImplementedError
+
+    async def _release(self, conn):
+        raise NotImplementedError
+
+    async def _acquire_within_timeout(self):
+        self.waiting += 1
+        try:
+            return await asyncio.wait_for(self._acquire(), self.pool_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise PoolExhausted('No database connection available within %.1fs' % self.pool_timeout)
+        finally:
+            self.waiting -= 1
+
+    @asynccontextmanager
+    async def transaction(self):
+        # Yields a cursor; commits on success, rolls back and re-raises otherwise. A cancelled
+        # transaction is left open and the pool discards the connection on release.
+        conn = await self._acquire_within_timeout()
+        try:
+            cursor = await conn.cursor()
+            try:
+                yield cursor
+            finally:
+                await cursor.close()
+            await conn.commit()
+        except self.integrity_errors as e:
+            await conn.rollback()
+            raise IntegrityViolation(str(e)) from e
+        except Exception:
+            await conn.rollback()
+            raise
+        finally:
+            await self._release(conn)
+
+    async def _execute(self, cursor, sql, params=()):
+        sql = self._sql(sql)
+        started = time.perf_counter()
+        try:
+            await cursor.execute(sql, tuple(params))
+        finally:
+            record_query(sql, time.perf_counter() - started)
+
+    async def _query(self, cursor, sql, params=()):
+        await self._execute(cursor, sql, params)
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, row)) for row in await cursor.fetchall()]
+
+    async def get_user_by_email(self, email):
+        async with self.transaction() as cursor:
+            rows = await self._query(cursor, USER_BY_EMAIL_QUERY, (email,))
+        return rows[0] if rows else None
+
+    async def create_user(self, name, email, password):
+        try:
+            async with self.transaction() as cursor:
+                await self._execute(cursor, INSERT_USER, (name, email, password))
+                user_id = cursor.lastrowid
+        except IntegrityViolation:
+            raise DuplicateEmail(email)
+        return {'id': user_id, 'name': name, 'email': email, 'password': password, 'has_voted': 0}
+
+    async def set_password(self, user_id, password):
+        async with self.transaction() as cursor:
+            await self._execute(cursor, 'UPDATE users SET password=%s WHERE id=%s', (password, user_id))
+
+    async def record_ballots(self, ballots):
+        rows, user_ids = collapse_ballots(ballots)
+        if not rows:
+            return
+        async with self.transaction() as cursor:
+            await self._execute(cursor, *self._lock_voters_statement(user_ids))
+            await cursor.fetchall()
+            await self._execute(cursor, *self._existing_votes_statement(user_ids))
+            existing = {(u, p): c for u, p, c in await cursor.fetchall()}
+            for sql, params in self._vote_write_statements(rows, user_ids, existing):
+                await self._execute(cursor, sql, params)
+
+    async def results(self):
+        async with self.transaction() as cursor:
+            return await self._query(cursor, RESULTS_QUERY)
+
+    async def ballot_version(self):
+        async with self.transaction() as cursor:
+            await self._execute(cursor, BALLOT_VERSION_QUERY)
+            row = await cursor.fetchone()
+        return row[0] if row else 0
+
+    async def load_ballot(self):
+        async with self.transaction() as cursor:
+            return await self._query(cursor, BALLOT_QUERY)
@@ -0,0 +1,160 @@
+from credentials import hash_password
+from tallies import diff_tallies
+
+USER_COLUMNS = ('id', 'name', 'email', 'password', 'has_voted')
+CANDIDATE_COLUMNS = ('id', 'name', 'image', 'position_id')
+
+
+class RepositoryError(Exception):
+    pass
+
+
+class DuplicateEmail(RepositoryError):
+    pass
+
+
+class UserHasVoted(RepositoryError):
+    pass
+
+
+class IntegrityViolation(RepositoryError):
+    # A write referenced a missing user/position/candidate or broke a uniqueness rule
+    pass
+
+
+class Repository:
+    # Storage interface used by the app. Every backend must keep these semantics
+    # (see storage.conformance): last-write-wins per (user_id, position_id), tallies
+    # updated in the same transaction as the votes, and a ballot version that is bumped
+    # by every position/candidate write.
+    name = 'abstract'
+
+    def initialize(self):
+        # Creates or upgrades the schema; returns the migration versions applied
+        raise NotImplementedError
+
+    def schema_version(self):
+        return None
+
+    def pool_stats(self):
+        return None
+
+    # Users
+
+    def get_user_by_email(self, email):
+        raise NotImplementedError
+
+    def create_user(self, name, email, password):
+        # Returns the new user row; raises DuplicateEmail
+        raise NotImplementedError
+
+    def insert_users(self, rows, mode='ignore'):
+        # rows: [(name, email, password)]; mode 'ignore' or 'upsert'. Returns rows inserted
+        # ('ignore') or rows written ('upsert').
+        raise NotImplementedError
+
+    def set_password(self, user_id, password):
+        # password is the stored (hashed) form, see credentials.hash_password
+        raise NotImplementedError
+
+    def list_users(self, fields, after=0, limit=100, has_voted=None, email_prefix=None):
+        # Returns (rows, next_cursor) ordered by id
+        raise NotImplementedError
+
+    def delete_user(self, user_id):
+        # Raises UserHasVoted if the user has any votes
+        raise NotImplementedError
+
+    def count_users(self):
+        # Returns (total, voted)
+        raise NotImplementedError
+
+    def position_turnout(self):
+        # [{position_id, position_name, category, voters}] from the tallies
+        raise NotImplementedError
+
+    # Ballot
+
+    def add_position(self, name, category):
+        raise NotImplementedError
+
+    def ballot_version(self):
+        raise NotImplementedError
+
+    def load_ballot(self):
+        # Rows of positions LEFT JOIN candidates: position_id, position_name, category,
+        # candidate_id, candidate_name, image; ordered by position then candidate
+        raise NotImplementedError
+
+    def list_candidates(self, fields, after=0, limit=100, position_id=None):
+        raise NotImplementedError
+
+    def get_candidate(self, candidate_id):
+        rows, _ = self.list_candidates(CANDIDATE_COLUMNS, after=candidate_id - 1, limit=1)
+        return rows[0] if rows and rows[0]['id'] == candidate_id else None
+
+    def add_candidate(self, name, image, position_id):
+        raise NotImplementedError
+
+    def update_candidate(self, candidate_id, name=None, position_id=None, image=None):
+        raise NotImplementedError
+
+    def set_candidate_image(self, candidate_id, image):
+        raise NotImplementedError
+
+    def delete_candidate(self, candidate_id):
+        raise NotImplementedError
+
+    # Votes
+
+    def record_ballots(self, ballots):
+        # ballots: [(user_id, {position_id: candidate_id})], written atomically; later
+        # entries win. Raises IntegrityViolation for unknown users/positions/candidates.
+        raise NotImplementedError
+
+    def results(self):
+        # [{position_id, position_name, candidate_id, candidate_name, votes}]
+        raise NotImplementedError
+
+    def vote_counts(self):
+        # {(position_id, candidate_id): n} counted from the votes themselves
+        raise NotImplementedError
+
+    def iter_votes(self, chunk_size=10000):
+        # Yields lists of (user_id, position_id, candidate_id), at most chunk_size each
+        raise NotImplementedError
+
+    def tally_counts(self):
+        raise NotImplementedError
+
+    def rebuild_tallies(self):
+        raise NotImplementedError
+
+    def tally_drift(self):
+        return diff_tallies(self.vote_counts(), self.tally_counts())
+
+    def seed_sample_data(self):
+        if self.count_users()[0] == 0:
+            self.insert_users([('John Doe', 'john@example.com', hash_password('Password123')),
+                               ('Jane Smith', 'jane@example.com', hash_password('Password123'))])
+        ballot = self.load_ballot()
+        if not ballot:
+            for name, category in (('President', 'students'), ('Secretary', 'students'),
+                                   ('Head Teacher', 'teachers'), ('Staff Rep', 'staff')):
+                self.add_position(name, category)
+            ballot = self.load_ballot()
+        if not any(row['candidate_id'] for row in ballot):
+            position_ids = {row['position_name']: row['position_id'] for row in ballot}
+            for name, position in (('Alice', 'President'), ('Bob', 'President'),
+                                   ('Carol', 'Secretary'), ('Dave', 'Secretary'),
+                                   ('Ms. Johnson', 'Head Teacher'), ('Mr. Smith', 'Head Teacher'),
+                                   ('Ms. Green', 'Staff Rep'), ('Mr. Brown', 'Staff Rep')):
+                self.add_candidate(name, None, position_ids[position])
+
+
+def page(rows, limit):
+    # rows were fetched with limit + 1 to learn whether another page exists
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, rows[-1]['id']
+    return rows, None
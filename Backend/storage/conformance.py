@@ -0,0 +1,261 @@
+"""Behavioural checks every storage backend must pass.
+
+    cd Backend
+    python -m storage.conformance                      # sqlite (temp file) and memory
+    python -m storage.conformance --backend mysql      # uses DB_* from .env; point DB_NAME at a scratch database
+
+Checks create their own users, positions and candidates under a random tag and only
+assert on those, but they do write to the target database.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import traceback
+
+from storage import create_repository, DuplicateEmail, UserHasVoted, IntegrityViolation
+from storage.migrations import LATEST_VERSION
+
+CHECKS = []
+
+
+def check(fn):
+    CHECKS.append(fn)
+    return fn
+
+
+class Fixture:
+    # A position with two candidates and a voter, all tagged so checks don't see each other's rows
+    def __init__(self, repo):
+        self.repo = repo
+        self.tag = os.urandom(4).hex()
+        self.position_id = repo.add_position(f'Position {self.tag}', 'conformance')
+        self.alice = repo.add_candidate(f'Alice {self.tag}', None, self.position_id)
+        self.bob = repo.add_candidate(f'Bob {self.tag}', None, self.position_id)
+
+    def user(self, n=0):
+        return self.repo.create_user(f'Voter {n}', f'voter{n}_{self.tag}@conformance.local', 'secret')
+
+    def results(self):
+        return {r['candidate_id']: r['votes'] for r in self.repo.results() if r['position_id'] == self.position_id}
+
+
+def expect(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def expect_raises(exc_type, fn, *args):
+    try:
+        fn(*args)
+    except exc_type:
+        return
+    raise AssertionError(f'{fn.__name__} did not raise {exc_type.__name__}')
+
+
+@check
+def initialize_is_idempotent(repo):
+    expect(repo.initialize() == [], 'initialize re-applied migrations on a current schema')
+    version = repo.schema_version()
+    expect(version is None or version == LATEST_VERSION, f'schema version {version}, expected {LATEST_VERSION}')
+
+
+@check
+def users_roundtrip(repo):
+    f = Fixture(repo)
+    user = f.user()
+    found = repo.get_user_by_email(user['email'])
+    expect(found is not None and found['id'] == user['id'], 'created user not found by email')
+    expect(found['has_voted'] == 0 and found['password'] == 'secret', f'unexpected user row {found}')
+    expect(repo.get_user_by_email('missing_' + user['email']) is None, 'unknown email returned a user')
+    expect_raises(DuplicateEmail, repo.create_user, 'Again', user['email'], 'x')
+    repo.set_password(user['id'], 'rehashed')
+    expect(repo.get_user_by_email(user['email'])['password'] == 'rehashed', 'set_password did not update the row')
+
+
+@check
+def insert_users_modes(repo):
+    f = Fixture(repo)
+    email = f'bulk_{f.tag}@conformance.local'
+    expect(repo.insert_users([('Bulk', email, 'a')]) == 1, 'ignore mode did not insert a new row')
+    expect(repo.insert_users([('Bulk 2', email, 'b')]) == 0, 'ignore mode touched an existing row')
+    expect(repo.get_user_by_email(email)['password'] == 'a', 'ignore mode overwrote an existing row')
+    repo.insert_users([('Bulk 3', email, 'c')], mode='upsert')
+    found = repo.get_user_by_email(email)
+    expect((found['name'], found['password']) == ('Bulk 3', 'c'), 'upsert mode did not update the row')
+
+
+@check
+def vote_overwrite_moves_tally(repo):
+    f = Fixture(repo)
+    user = f.user()
+    repo.record_ballots([(user['id'], {f.position_id: f.alice})])
+    expect(f.results() == {f.alice: 1, f.bob: 0}, f'first vote: {f.results()}')
+    repo.record_ballots([(user['id'], {f.position_id: f.bob})])
+    expect(f.results() == {f.alice: 0, f.bob: 1}, f'changed vote: {f.results()}')
+    repo.record_ballots([(user['id'], {f.position_id: f.bob})])
+    expect(f.results() == {f.alice: 0, f.bob: 1}, f'repeated vote: {f.results()}')
+    expect(repo.get_user_by_email(user['email'])['has_voted'] == 1, 'has_voted not set')
+
+
+@check
+def last_write_wins_within_batch(repo):
+    f = Fixture(repo)
+    first, second = f.user(1), f.user(2)
+    repo.record_ballots([(first['id'], {f.position_id: f.alice}),
+                         (second['id'], {f.position_id: f.alice}),
+                         (first['id'], {f.position_id: f.bob})])
+    expect(f.results() == {f.alice: 1, f.bob: 1}, f'batch result: {f.results()}')
+
+
+@check
+def invalid_ballot_rolls_back_batch(repo):
+    f = Fixture(repo)
+    user = f.user()
+    expect_raises(IntegrityViolation, repo.record_ballots,
+                  [(user['id'], {f.position_id: f.alice}), (user['id'] + 10 ** 6, {f.position_id: f.bob})])
+    expect(f.results() == {f.alice: 0, f.bob: 0}, f'partial batch was written: {f.results()}')
+    expect(repo.get_user_by_email(user['email'])['has_voted'] == 0, 'has_voted set by a failed batch')
+
+
+@check
+def tallies_match_votes(repo):
+    f = Fixture(repo)
+    users = [f.user(n) for n in range(5)]
+    repo.record_ballots([(u['id'], {f.position_id: f.alice if n % 2 else f.bob}) for n, u in enumerate(users)])
+    repo.record_ballots([(users[0]['id'], {f.position_id: f.alice})])
+    own = [d for d in repo.tally_drift() if d[0] == f.position_id]
+    expect(not own, f'tallies drifted: {own}')
+    repo.rebuild_tallies()
+    expect(f.results() == {f.alice: 3, f.bob: 2}, f'after rebuild: {f.results()}')
+    turnout = {p['position_id']: p['voters'] for p in repo.position_turnout()}
+    expect(turnout.get(f.position_id) == 5, f'turnout {turnout.get(f.position_id)}, expected 5')
+
+
+@check
+def iter_votes_lists_current_votes(repo):
+    f = Fixture(repo)
+    users = [f.user(n) for n in range(3)]
+    repo.record_ballots([(u['id'], {f.position_id: f.alice}) for u in users])
+    repo.record_ballots([(users[1]['id'], {f.position_id: f.bob})])
+    ids = {u['id'] for u in users}
+    own = sorted(v for chunk in repo.iter_votes(chunk_size=2) for v in chunk if v[0] in ids)
+    expected = sorted((u['id'], f.position_id, f.bob if n == 1 else f.alice) for n, u in enumerate(users))
+    expect(own == expected, f'iter_votes {own}, expected {expected}')
+
+
+@check
+def delete_user_with_votes_refused(repo):
+    f = Fixture(repo)
+    voter, other = f.user(1), f.user(2)
+    repo.record_ballots([(voter['id'], {f.position_id: f.alice})])
+    expect_raises(UserHasVoted, repo.delete_user, voter['id'])
+    repo.delete_user(other['id'])
+    expect(repo.get_user_by_email(other['email']) is None, 'user was not deleted')
+    expect(repo.get_user_by_email(voter['email']) is not None, 'voter was deleted')
+
+
+@check
+def delete_candidate_with_votes_refused(repo):
+    f = Fixture(repo)
+    repo.record_ballots([(f.user()['id'], {f.position_id: f.alice})])
+    expect_raises(IntegrityViolation, repo.delete_candidate, f.alice)
+    expect(f.results() == {f.alice: 1, f.bob: 0}, f'tallies changed by a failed delete: {f.results()}')
+    repo.delete_candidate(f.bob)
+    expect(f.results() == {f.alice: 1}, f'after deleting bob: {f.results()}')
+
+
+@check
+def ballot_version_and_shape(repo):
+    f = Fixture(repo)
+    version = repo.ballot_version()
+    empty_position = repo.add_position(f'Empty {f.tag}', 'conformance')
+    expect(repo.ballot_version() > version, 'add_position did not bump the ballot version')
+    for write in (lambda: repo.set_candidate_image(f.alice, '/uploads/a.png'),
+                  lambda: repo.update_candidate(f.bob, name=f'Robert {f.tag}'),
+                  lambda: repo.add_candidate(f'Carol {f.tag}', None, f.position_id)):
+        version = repo.ballot_version()
+        write()
+        expect(repo.ballot_version() > version, 'candidate write did not bump the ballot version')
+    rows = [r for r in repo.load_ballot() if r['position_id'] in (f.position_id, empty_position)]
+    expect([r['candidate_id'] for r in rows][-1] is None, 'position without candidates missing from ballot')
+    mine = [r for r in rows if r['position_id'] == f.position_id]
+    expect([r['candidate_id'] for r in mine] == sorted(r['candidate_id'] for r in mine), 'ballot not ordered by id')
+    expect(mine[0]['image'] == '/uploads/a.png' and mine[1]['candidate_name'] == f'Robert {f.tag}',
+           f'candidate updates not visible: {mine[:2]}')
+    page, next_cursor = repo.list_candidates(('id', 'name'), limit=10, position_id=f.position_id)
+    expect([c['id'] for c in page] == [r['candidate_id'] for r in mine] and next_cursor is None,
+           f'list_candidates by position: {page}')
+
+
+@check
+def keyset_pagination(repo):
+    f = Fixture(repo)
+    prefix = f'page_{f.tag}'
+    ids = [repo.create_user('P', f'{prefix}{n}@conformance.local', 'x')['id'] for n in range(5)]
+    # '_' must match literally, not as a LIKE wildcard
+    repo.create_user('P', f'pageX{f.tag}0@conformance.local', 'x')
+    seen, after = [], 0
+    while True:
+        rows, after = repo.list_users(('id', 'email'), after=after, limit=2, email_prefix=prefix)
+        expect(len(rows) <= 2, f'page larger than limit: {rows}')
+        seen.extend(r['id'] for r in rows)
+        if after is None:
+            break
+    expect(seen == ids, f'paged ids {seen}, expected {ids}')
+    repo.record_ballots([(ids[1], {f.position_id: f.alice})])
+    rows, _ = repo.list_users(('id',), limit=10, email_prefix=prefix, has_voted=True)
+    expect([r['id'] for r in rows] == [ids[1]], f'has_voted filter: {rows}')
+
+
+def run_checks(make_repo):
+    # make_repo() returns an initialized repository; each check gets its own
+    failures = []
+    for fn in CHECKS:
+        try:
+            fn(make_repo())
+        except Exception:
+            failures.append((fn.__name__, traceback.format_exc()))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', action='append', choices=('mysql', 'sqlite', 'memory'),
+                        help='Backend to check; repeatable. Defaults to sqlite and memory.')
+    args = parser.parse_args(argv)
+    tmpdir = tempfile.mkdtemp(prefix='storage-conformance-')
+    failed = False
+    try:
+        for backend in args.backend or ['sqlite', 'memory']:
+            failures = run_checks(lambda: _make(backend, tmpdir))
+            for name, error in failures:
+                print(f'FAIL {backend}: {name}\n{error}')
+            print(f'{backend}: {len(CHECKS) - len(failures)}/{len(CHECKS)} checks passed')
+            failed = failed or bool(failures)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return 1 if failed else 0
+
+
+def _make(backend, tmpdir):
+    if backend == 'sqlite':
+        repo = create_repository('sqlite', path=tempfile.mktemp(suffix='.db', dir=tmpdir))
+    elif backend == 'mysql':
+        from dotenv import load_dotenv
+        load_dotenv()
+        repo = create_repository('mysql', config={
+            'host': os.getenv('DB_HOST', 'localhost'),
+            'port': int(os.getenv('DB_PORT', 3306)),
+            'user': os.getenv('DB_USER', 'root'),
+            'password': os.getenv('DB_PASSWORD', ''),
+        }, database=os.getenv('DB_NAME'), pool_size=2)
+    else:
+        repo = create_repository(backend)
+    repo.initialize()
+    return repo
+
+
+if __name__ == '__main__':
+    sys.exit(main())
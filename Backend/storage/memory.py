@@ -0,0 +1,233 @@
+import bisect
+import threading
+from collections import Counter
+
+from storage.base import (Repository, DuplicateEmail, UserHasVoted, IntegrityViolation,
+                          CANDIDATE_COLUMNS, page)
+from tallies import vote_deltas
+
+
+def _vote_key(user_id, position_id):
+    # One int per (user, position) keeps a few million votes at a few hundred MB at most
+    return (user_id << 32) | position_id
+
+
+class InMemoryRepository(Repository):
+    # Process-local backend for tests, demos and benchmarks: nothing is persisted and
+    # state is not shared between worker processes. One lock makes every call atomic.
+    name = 'memory'
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._users = {}
+        self._user_ids = []
+        self._emails = {}
+        self._positions = {}
+        self._candidates = {}
+        self._votes = {}
+        self._votes_by_user = Counter()
+        self._tallies = Counter()
+        self._version = 0
+        self._next_id = Counter()
+
+    def _new_id(self, table):
+        self._next_id[table] += 1
+        return self._next_id[table]
+
+    def initialize(self):
+        return []
+
+    # Users
+
+    def get_user_by_email(self, email):
+        with self._lock:
+            user_id = self._emails.get(email)
+            return dict(self._users[user_id]) if user_id is not None else None
+
+    def _insert_user(self, name, email, password):
+        user_id = self._new_id('users')
+        self._users[user_id] = {'id': user_id, 'name': name, 'email': email, 'password': password, 'has_voted': 0}
+        self._user_ids.append(user_id)
+        self._emails[email] = user_id
+        return self._users[user_id]
+
+    def create_user(self, name, email, password):
+        with self._lock:
+            if email in self._emails:
+                raise DuplicateEmail(email)
+            return dict(self._insert_user(name, email, password))
+
+    def insert_users(self, rows, mode='ignore'):
+        written = 0
+        with self._lock:
+            for name, email, password in rows:
+                user_id = self._emails.get(email)
+                if user_id is None:
+                    self._insert_user(name, email, password)
+                    written += 1
+                elif mode == 'upsert':
+                    self._users[user_id].update(name=name, password=password)
+                    written += 1
+        return written
+
+    def set_password(self, user_id, password):
+        with self._lock:
+            if user_id in self._users:
+                self._users[user_id]['password'] = password
+
+    def list_users(self, fields, after=0, limit=100, has_voted=None, email_prefix=None):
+        rows = []
+        with self._lock:
+            for user_id in self._user_ids[bisect.bisect_right(self._user_ids, after):]:
+                user = self._users[user_id]
+                if has_voted is not None and user['has_voted'] != int(has_voted):
+                    continue
+                if email_prefix and not user['email'].startswith(email_prefix):
+                    continue
+                rows.append({f: user[f] for f in fields})
+                if len(rows) > limit:
+                    break
+        return page(rows, limit)
+
+    def delete_user(self, user_id):
+        with self._lock:
+            if self._votes_by_user[user_id]:
+                raise UserHasVoted(user_id)
+            user = self._users.pop(user_id, None)
+            if user is not None:
+                del self._emails[user['email']]
+                self._user_ids.remove(user_id)
+
+    def count_users(self):
+        with self._lock:
+            return len(self._users), sum(1 for u in self._users.values() if u['has_voted'])
+
+    def position_turnout(self):
+        with self._lock:
+            voters = Counter()
+            for (position_id, _), n in self._tallies.items():
+                voters[position_id] += n
+            return [{'position_id': p['id'], 'position_name': p['name'], 'category': p['category'],
+                     'voters': voters[p['id']]} for p in self._positions.values()]
+
+    # Ballot
+
+    def add_position(self, name, category):
+        with self._lock:
+            position_id = self._new_id('positions')
+            self._positions[position_id] = {'id': position_id, 'name': name, 'category': category}
+            self._version += 1
+            return position_id
+
+    def ballot_version(self):
+        return self._version
+
+    def load_ballot(self):
+        with self._lock:
+            by_position = {}
+            for c in self._candidates.values():
+                by_position.setdefault(c['position_id'], []).append(c)
+            rows = []
+            for p in self._positions.values():
+                base = {'position_id': p['id'], 'position_name': p['name'], 'category': p['category']}
+                candidates = sorted(by_position.get(p['id'], []), key=lambda c: c['id'])
+                if not candidates:
+                    rows.append(dict(base, candidate_id=None, candidate_name=None, image=None))
+                for c in candidates:
+                    rows.append(dict(base, candidate_id=c['id'], candidate_name=c['name'], image=c['image']))
+            return rows
+
+    def list_candidates(self, fields, after=0, limit=100, position_id=None):
+        with self._lock:
+            rows = [{f: c[f] for f in fields} for c in self._candidates.values()
+                    if c['id'] > after and (position_id is None or c['position_id'] == position_id)]
+        return page(rows[:limit + 1], limit)
+
+    def add_candidate(self, name, image, position_id):
+        with self._lock:
+            if position_id not in self._positions:
+                raise IntegrityViolation(f'Unknown position {position_id}.')
+            candidate_id = self._new_id('candidates')
+            self._candidates[candidate_id] = dict(zip(CANDIDATE_COLUMNS, (candidate_id, name, image, position_id)))
+            self._version += 1
+            return candidate_id
+
+    def update_candidate(self, candidate_id, name=None, position_id=None, image=None):
+        changes = {k: v for k, v in (('name', name), ('position_id', position_id), ('image', image)) if v}
+        if not changes:
+            return
+        with self._lock:
+            if 'position_id' in changes and changes['position_id'] not in self._positions:
+                raise IntegrityViolation(f'Unknown position {position_id}.')
+            if candidate_id in self._candidates:
+                self._candidates[candidate_id].update(changes)
+            self._version += 1
+
+    def set_candidate_image(self, candidate_id, image):
+        with self._lock:
+            if candidate_id in self._candidates:
+                self._candidates[candidate_id]['image'] = image
+            self._version += 1
+
+    def delete_candidate(self, candidate_id):
+        with self._lock:
+            candidate = self._candidates.get(candidate_id)
+            if candidate is not None:
+                if self._tallies[(candidate['position_id'], candidate_id)]:
+                    # Same outcome as the votes -> candidates foreign key in the SQL backends
+                    raise IntegrityViolation(f'Candidate {candidate_id} has votes.')
+                self._tallies.pop((candidate['position_id'], candidate_id), None)
+                del self._candidates[candidate_id]
+            self._version += 1
+
+    # Votes
+
+    def record_ballots(self, ballots):
+        with self._lock:
+            rows = {}
+            for user_id, votes in ballots:
+                if user_id not in self._users:
+                    raise IntegrityViolation(f'Unknown user {user_id}.')
+                for position_id, candidate_id in votes.items():
+                    if position_id not in self._positions or candidate_id not in self._candidates:
+                        raise IntegrityViolation(f'Unknown position {position_id} or candidate {candidate_id}.')
+                    rows[(user_id, position_id)] = candidate_id
+            existing = {}
+            for user_id, position_id in rows:
+                candidate_id = self._votes.get(_vote_key(user_id, position_id))
+                if candidate_id is not None:
+                    existing[(user_id, position_id)] = candidate_id
+            for (user_id, position_id), candidate_id in rows.items():
+                if (user_id, position_id) not in existing:
+                    self._votes_by_user[user_id] += 1
+                self._votes[_vote_key(user_id, position_id)] = candidate_id
+                self._users[user_id]['has_voted'] = 1
+            self._tallies.update(vote_deltas(existing, rows))
+
+    def results(self):
+        with self._lock:
+            return [{'position_id': row['position_id'], 'position_name': row['position_name'],
+                     'candidate_id': row['candidate_id'], 'candidate_name': row['candidate_name'],
+                     'votes': self._tallies[(row['position_id'], row['candidate_id'])]}
+                    for row in self.load_ballot() if row['candidate_id'] is not None]
+
+    def vote_counts(self):
+        with self._lock:
+            counts = Counter()
+            for key, candidate_id in self._votes.items():
+                counts[(key & 0xFFFFFFFF, candidate_id)] += 1
+            return dict(counts)
+
+    def iter_votes(self, chunk_size=10000):
+        with self._lock:
+            votes = [(key >> 32, key & 0xFFFFFFFF, candidate_id) for key, candidate_id in self._votes.items()]
+        for start in range(0, len(votes), chunk_size):
+            yield votes[start:start + chunk_size]
+
+    def tally_counts(self):
+        with self._lock:
+            return {key: n for key, n in self._tallies.items() if n}
+
+    def rebuild_tallies(self):
+        with self._lock:
+            self._tallies = Counter(self.vote_counts())
@@ -0,0 +1,60 @@
+# Versioned schema changes for the SQL backends. Each migration runs once per database
+# and is recorded in schema_migrations. MySQL commits DDL implicitly, so a migration can
+# be cut short between statements: every step must be safe to run again.
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+@migration(1, 'Create users, positions, candidates and votes')
+def create_base_tables(repo, cursor):
+    for statement in repo.base_schema.split(';'):
+        if statement.strip():
+            repo._execute(cursor, statement)
+
+
+@migration(2, 'Add votes.voted_at to databases created from the old schema.sql')
+def add_votes_voted_at(repo, cursor):
+    if not repo._has_column(cursor, 'votes', 'voted_at'):
+        repo._execute(cursor, 'ALTER TABLE votes ADD COLUMN voted_at TIMESTAMP' + repo.timestamp_default)
+
+
+@migration(3, 'Add the ballot version counter and the tallies table')
+def add_ballot_version_and_tallies(repo, cursor):
+    repo._execute(cursor, '''
+        CREATE TABLE IF NOT EXISTS ballot_version (
+            id INT PRIMARY KEY,
+            version INT NOT NULL DEFAULT 0
+        )''')
+    repo._execute(cursor, f'{repo.insert_ignore} INTO ballot_version (id, version) VALUES (1, 0)')
+    repo._execute(cursor, '''
+        CREATE TABLE IF NOT EXISTS tallies (
+            position_id INT NOT NULL,
+            candidate_id INT NOT NULL,
+            count INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (position_id, candidate_id)
+        )''')
+    # Existing votes are counted into the new table
+    repo._rebuild_tallies(cursor)
+
+
+@migration(4, 'Index users(has_voted) and votes(position_id, candidate_id)')
+def add_hot_query_indexes(repo, cursor):
+    # has_voted: turnout counts and the /api/users filter. (position_id, candidate_id):
+    # covers the GROUP BY behind recount and the tally rebuild.
+    repo._ensure_index(cursor, 'users', 'idx_users_has_voted', 'has_voted')
+    repo._ensure_index(cursor, 'votes', 'idx_votes_position_candidate', 'position_id, candidate_id')
+
+
+@migration(5, 'Widen users.password for salted hashes')
+def widen_users_password(repo, cursor):
+    repo._widen_column(cursor, 'users', 'password', 'VARCHAR(255)')
+
+
+LATEST_VERSION = max(version for version, _, _ in MIGRATIONS)
@@ -0,0 +1,94 @@
+import logging
+from contextlib import contextmanager
+
+import mysql.connector
+
+from db_pool import ConnectionPool
+from storage.sql import SQLDialect, SQLRepository
+
+logger = logging.getLogger(__name__)
+
+# Tables as first created; later changes are in storage.migrations
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(100),
+    email VARCHAR(100) UNIQUE,
+    password VARCHAR(100),
+    has_voted BOOLEAN DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS positions (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(100),
+    category VARCHAR(100)
+);
+CREATE TABLE IF NOT EXISTS candidates (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    name VARCHAR(100),
+    image VARCHAR(255),
+    position_id INT,
+    FOREIGN KEY (position_id) REFERENCES positions(id)
+);
+CREATE TABLE IF NOT EXISTS votes (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    user_id INT,
+    position_id INT,
+    candidate_id INT,
+    voted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    FOREIGN KEY (position_id) REFERENCES positions(id),
+    FOREIGN KEY (candidate_id) REFERENCES candidates(id),
+    UNIQUE KEY unique_vote (user_id, position_id)
+);
+"""
+
+
+class MySQLDialect(SQLDialect):
+    def _upsert_clause(self, key, updates):
+        return ' ON DUPLICATE KEY UPDATE ' + ', '.join(
+            f"{column}={expression.format(new=f'VALUES({column})')}" for column, expression in updates.items())
+
+
+class MySQLRepository(MySQLDialect, SQLRepository):
+    name = 'mysql'
+    integrity_errors = (mysql.connector.IntegrityError, mysql.connector.DataError)
+
+    base_schema = SCHEMA
+
+    def __init__(self, config, database, pool_size=10, pool_timeout=5.0, recycle=1800,
+                 ping_interval=30.0, wrap_cursor=None):
+        config = dict(config, database=database)
+        super().__init__(ConnectionPool(lambda: mysql.connector.connect(**config), size=pool_size,
+                                        timeout=pool_timeout, recycle=recycle, ping_interval=ping_interval,
+                                        wrap_cursor=wrap_cursor))
+
+    def _ensure_index(self, cursor, table, name, columns):
+        # MySQL has no CREATE INDEX IF NOT EXISTS
+        self._execute(
+            cursor,
+            'SELECT 1 FROM information_schema.statistics WHERE table_schema=DATABASE() AND table_name=%s AND index_name=%s LIMIT 1',
+            (table, name))
+        if cursor.fetchone() is None:
+            self._execute(cursor, f'CREATE INDEX {name} ON {table} ({columns})')
+
+    def _has_column(self, cursor, table, column):
+        self._execute(
+            cursor,
+            'SELECT 1 FROM information_schema.columns WHERE table_schema=DATABASE() AND table_name=%s AND column_name=%s',
+            (table, column))
+        return cursor.fetchone() is not None
+
+    def _widen_column(self, cursor, table, column, definition):
+        self._execute(cursor, f'ALTER TABLE {table} MODIFY {column} {definition}')
+
+    @contextmanager
+    def _migration_lock(self, cursor):
+        # DDL commits implicitly in MySQL, so serialize on a named lock instead of a transaction
+        self._execute(cursor, "SELECT GET_LOCK('voting_schema_migrations', 60)")
+        if cursor.fetchone()[0] != 1:
+            raise RuntimeError('Timed out waiting for another process to finish migrating')
+        try:
+            yield
+        finally:
+            self._execute(cursor, "SELECT RELEASE_LOCK('voting_schema_migrations')")
+            cursor.fetchone()
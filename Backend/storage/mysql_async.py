@@ -0,0 +1,47 @@
+import aiomysql
+import pymysql
+
+from storage.aio import AsyncSQLRepository
+from storage.mysql import MySQLDialect
+
+
+class AsyncMySQLRepository(MySQLDialect, AsyncSQLRepository):
+    name = 'mysql'
+    integrity_errors = (pymysql.err.IntegrityError, pymysql.err.DataError)
+
+    def __init__(self, config, database, pool_size=10, pool_timeout=5.0, recycle=1800):
+        super().__init__(pool_timeout=pool_timeout)
+        self._config = dict(config, db=database)
+        self.pool_size = pool_size
+        self.recycle = recycle
+        self._pool = None
+
+    async def open(self):
+        # The pool is bound to the running event loop, so it is created at ASGI startup
+        if self._pool is None:
+            self._pool = await aiomysql.create_pool(minsize=1, maxsize=self.pool_size, pool_recycle=self.recycle,
+                                                    autocommit=False, **self._config)
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    async def _acquire(self):
+        return await self._pool.acquire()
+
+    async def _release(self, conn):
+        await self._pool.release(conn)
+
+    def pool_stats(self):
+        if self._pool is None:
+            return None
+        return {
+            'size': self.pool_size,
+            'open': self._pool.size,
+            'idle': self._pool.freesize,
+            'in_use': self._pool.size - self._pool.freesize,
+            'waiting': self.waiting,
+            'timeouts': self.timeouts,
+        }
@@ -0,0 +1,381 @@
+import logging
+from contextlib import contextmanager
+
+from storage.base import Repository, DuplicateEmail, UserHasVoted, IntegrityViolation, USER_COLUMNS, page
+from storage.migrations import MIGRATIONS, LATEST_VERSION
+from tallies import vote_deltas
+
+logger = logging.getLogger(__name__)
+
+BALLOT_QUERY = '''
+    SELECT p.id AS position_id, p.name AS position_name, p.category,
+           c.id AS candidate_id, c.name AS candidate_name, c.image
+    FROM positions p
+    LEFT JOIN candidates c ON c.position_id = p.id
+    ORDER BY p.id, c.id
+'''
+
+USER_BY_EMAIL_QUERY = f"SELECT {', '.join(USER_COLUMNS)} FROM users WHERE email=%s"
+INSERT_USER = 'INSERT INTO users (name, email, password, has_voted) VALUES (%s, %s, %s, 0)'
+BALLOT_VERSION_QUERY = 'SELECT version FROM ballot_version WHERE id=1'
+
+RESULTS_QUERY = '''
+    SELECT p.id as position_id, p.name as position_name, c.id as candidate_id, c.name as candidate_name, COALESCE(t.count, 0) as votes
+    FROM positions p
+    JOIN candidates c ON c.position_id = p.id
+    LEFT JOIN tallies t ON t.position_id = p.id AND t.candidate_id = c.id
+    ORDER BY p.id, c.id
+'''
+
+
+def escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def collapse_ballots(ballots):
+    # {(user_id, position_id): candidate_id} with later ballots winning, plus the sorted voter ids
+    rows = {}
+    for user_id, votes in ballots:
+        for position_id, candidate_id in votes.items():
+            rows[(user_id, position_id)] = candidate_id
+    return rows, sorted({user_id for user_id, _ in ballots})
+
+
+class SQLDialect:
+    # SQL text shared by the sync and async repositories. Queries are written with %s
+    # placeholders; dialect differences live in the class attributes and _upsert_clause.
+    placeholder = '%s'
+    insert_ignore = 'INSERT IGNORE'
+    cast_int = 'SIGNED'
+    like_escape = ''
+    for_update = ' FOR UPDATE'
+
+    def _sql(self, sql):
+        return sql if self.placeholder == '%s' else sql.replace('%s', self.placeholder)
+
+    def _upsert_clause(self, key, updates):
+        raise NotImplementedError
+
+    def _upsert_statement(self, table, columns, rows, key, updates):
+        # updates: {column: expression}, where {new} stands for the incoming value
+        params = []
+        for row in rows:
+            params.extend(row)
+        values = '(' + ', '.join(['%s'] * len(columns)) + ')'
+        return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ', '.join([values] * len(rows))
+                + self._upsert_clause(key, updates), params)
+
+    def _lock_voters_statement(self, user_ids):
+        # Serializes writes per voter so overwrites decrement the right tally. Locking the users
+        # rows by primary key takes record locks only; FOR UPDATE on votes would also take gap
+        # locks for first-time voters, and two of those in one gap deadlock on the insert.
+        return ('SELECT id FROM users WHERE id IN (' + ', '.join(['%s'] * len(user_ids)) + ')'
+                + self.for_update, user_ids)
+
+    def _existing_votes_statement(self, user_ids):
+        return ('SELECT user_id, position_id, candidate_id FROM votes WHERE user_id IN ('
+                + ', '.join(['%s'] * len(user_ids)) + ')', user_ids)
+
+    def _vote_write_statements(self, rows, user_ids, existing):
+        # Constant number of statements per batch, keeping the tallies in step within the
+        # same transaction. Later ballots win over earlier ones, as the upsert does per row.
+        statements = [self._upsert_statement(
+            'votes', ('user_id', 'position_id', 'candidate_id'), [(u, p, c) for (u, p), c in rows.items()],
+            ('user_id', 'position_id'), {'candidate_id': '{new}'})]
+        # deltas: {(position_id, candidate_id): +n/-n}; applied as one multi-row upsert, in key
+        # order so concurrent batches lock the hot tallies rows in the same order
+        deltas = [(p, c, d) for (p, c), d in sorted(vote_deltas(existing, rows).items()) if d]
+        if deltas:
+            statements.append(self._upsert_statement(
+                'tallies', ('position_id', 'candidate_id', 'count'), deltas,
+                ('position_id', 'candidate_id'), {'count': 'count + {new}'}))
+        statements.append(('UPDATE users SET has_voted=1 WHERE id IN (' + ', '.join(['%s'] * len(user_ids)) + ')',
+                           user_ids))
+        return statements
+
+
+class SQLRepository(SQLDialect, Repository):
+    # Shared implementation for DB-API backends behind a ConnectionPool
+    integrity_errors = ()
+    base_schema = ''  # DDL for migration 1
+    timestamp_default = ' DEFAULT CURRENT_TIMESTAMP'
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def pool_stats(self):
+        return self.pool.stats()
+
+    @contextmanager
+    def transaction(self):
+        # Yields a cursor; commits on success, rolls back and re-raises otherwise
+        db = self.pool.acquire()
+        cursor = db.cursor()
+        try:
+            yield cursor
+            db.commit()
+        except self.integrity_errors as e:
+            db.rollback()
+            raise IntegrityViolation(str(e)) from e
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            cursor.close()
+            db.close()
+
+    def _execute(self, cursor, sql, params=()):
+        cursor.execute(self._sql(sql), tuple(params))
+
+    def _query(self, cursor, sql, params=()):
+        self._execute(cursor, sql, params)
+        columns = [d[0] for d in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def _lock_votes(self, cursor):
+        # Hook for backends without row locks to take a write lock before SELECT ... FOR UPDATE
+        pass
+
+    # Schema
+
+    @contextmanager
+    def _migration_lock(self, cursor):
+        # Hook: keep concurrently starting workers from migrating at the same time
+        yield
+
+    def _has_column(self, cursor, table, column):
+        raise NotImplementedError
+
+    def _ensure_index(self, cursor, table, name, columns):
+        raise NotImplementedError
+
+    def _widen_column(self, cursor, table, column, definition):
+        raise NotImplementedError
+
+    def schema_version(self):
+        with self.transaction() as cursor:
+            self._execute(cursor, 'SELECT MAX(version) FROM schema_migrations')
+            return cursor.fetchone()[0] or 0
+
+    def initialize(self):
+        # Applies pending migrations and returns their versions. On a current schema
+        # this is the single schema_version() query.
+        try:
+            if self.schema_version() >= LATEST_VERSION:
+                return []
+        except Exception:
+            # No schema_migrations table yet; anything else fails again below
+            pass
+        applied = []
+        with self.transaction() as cursor, self._migration_lock(cursor):
+            self._execute(cursor, '''
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    description VARCHAR(255),
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )''')
+            self._execute(cursor, 'SELECT version FROM schema_migrations')
+            done = {row[0] for row in cursor.fetchall()}
+            for version, description, apply in MIGRATIONS:
+                if version in done:
+                    continue
+                logger.info('Applying migration %d: %s', version, description)
+                apply(self, cursor)
+                self._execute(cursor, 'INSERT INTO schema_migrations (version, description) VALUES (%s, %s)',
+                              (version, description))
+                applied.append(version)
+        return applied
+
+    def _bump_ballot_version(self, cursor):
+        # Inside the transaction that changes positions/candidates so every worker reloads
+        self._execute(cursor, 'UPDATE ballot_version SET version=version+1 WHERE id=1')
+
+    def _rebuild_tallies(self, cursor):
+        self._execute(cursor, 'DELETE FROM tallies')
+        self._execute(cursor, '''
+            INSERT INTO tallies (position_id, candidate_id, count)
+            SELECT position_id, candidate_id, COUNT(*) FROM votes GROUP BY position_id, candidate_id
+        ''')
+
+    def _keyset_page(self, cursor, table, fields, where, params, after, limit):
+        # Fetches one page ordered by id, using the primary key (or a (filter, id) index) to seek
+        conditions = ['id > %s'] + where
+        rows = self._query(
+            cursor,
+            f"SELECT {', '.join(fields)} FROM {table} WHERE {' AND '.join(conditions)} ORDER BY id LIMIT %s",
+            [after] + params + [limit + 1])
+        return page(rows, limit)
+
+    # Users
+
+    def get_user_by_email(self, email):
+        with self.transaction() as cursor:
+            rows = self._query(cursor, USER_BY_EMAIL_QUERY, (email,))
+        return rows[0] if rows else None
+
+    def create_user(self, name, email, password):
+        try:
+            with self.transaction() as cursor:
+                self._execute(cursor, INSERT_USER, (name, email, password))
+                user_id = cursor.lastrowid
+        except IntegrityViolation:
+            raise DuplicateEmail(email)
+        return {'id': user_id, 'name': name, 'email': email, 'password': password, 'has_voted': 0}
+
+    def insert_users(self, rows, mode='ignore'):
+        if not rows:
+            return 0
+        with self.transaction() as cursor:
+            if mode == 'upsert':
+                self._execute(cursor, *self._upsert_statement('users', ('name', 'email', 'password'), rows,
+                                                              ('email',), {'name': '{new}', 'password': '{new}'}))
+                return len(rows)
+            params = []
+            for row in rows:
+                params.extend(row)
+            self._execute(cursor, f'{self.insert_ignore} INTO users (name, email, password, has_voted) VALUES '
+                          + ', '.join(['(%s, %s, %s, 0)'] * len(rows)), params)
+            return cursor.rowcount
+
+    def set_password(self, user_id, password):
+        with self.transaction() as cursor:
+            self._execute(cursor, 'UPDATE users SET password=%s WHERE id=%s', (password, user_id))
+
+    def list_users(self, fields, after=0, limit=100, has_voted=None, email_prefix=None):
+        where, params = [], []
+        if has_voted is not None:
+            where.append('has_voted=%s')
+            params.append(int(has_voted))
+        if email_prefix:
+            where.append('email LIKE %s' + self.like_escape)
+            params.append(escape_like(email_prefix) + '%')
+        with self.transaction() as cursor:
+            return self._keyset_page(cursor, 'users', fields, where, params, after, limit)
+
+    def delete_user(self, user_id):
+        with self.transaction() as cursor:
+            self._execute(cursor, 'SELECT EXISTS(SELECT 1 FROM votes WHERE user_id=%s)', (user_id,))
+            if cursor.fetchone()[0]:
+                raise UserHasVoted(user_id)
+            self._execute(cursor, 'DELETE FROM users WHERE id=%s', (user_id,))
+
+    def count_users(self):
+        with self.transaction() as cursor:
+            self._execute(cursor, 'SELECT COUNT(*), (SELECT COUNT(*) FROM users WHERE has_voted=1) FROM users')
+            total, voted = cursor.fetchone()
+        return int(total), int(voted)
+
+    def position_turnout(self):
+        # Each (user, position) has one vote row, so a position's tally sum is the number of voters for it
+        with self.transaction() as cursor:
+            return self._query(cursor, f'''
+                SELECT p.id AS position_id, p.name AS position_name, p.category,
+                       CAST(COALESCE(SUM(t.count), 0) AS {self.cast_int}) AS voters
+                FROM positions p
+                LEFT JOIN tallies t ON t.position_id = p.id
+                GROUP BY p.id, p.name, p.category
+                ORDER BY p.id
+            ''')
+
+    # Ballot
+
+    def add_position(self, name, category):
+        with self.transaction() as cursor:
+            self._execute(cursor, 'INSERT INTO positions (name, category) VALUES (%s, %s)', (name, category))
+            position_id = cursor.lastrowid
+            self._bump_ballot_version(cursor)
+        return position_id
+
+    def ballot_version(self):
+        with self.transaction() as cursor:
+            self._execute(cursor, BALLOT_VERSION_QUERY)
+            row = cursor.fetchone()
+        return row[0] if row else 0
+
+    def load_ballot(self):
+        with self.transaction() as cursor:
+            return self._query(cursor, BALLOT_QUERY)
+
+    def list_candidates(self, fields, after=0, limit=100, position_id=None):
+        where, params = [], []
+        if position_id is not None:
+            where.append('position_id=%s')
+            params.append(position_id)
+        with self.transaction() as cursor:
+            return self._keyset_page(cursor, 'candidates', fields, where, params, after, limit)
+
+    def add_candidate(self, name, image, position_id):
+        with self.transaction() as cursor:
+            self._execute(cursor, 'INSERT INTO candidates (name, image, position_id) VALUES (%s, %s, %s)',
+                          (name, image, position_id))
+            candidate_id = cursor.lastrowid
+            self._bump_ballot_version(cursor)
+        return candidate_id
+
+    def update_candidate(self, candidate_id, name=None, position_id=None, image=None):
+        fields = [(column, value) for column, value in
+                  (('name', name), ('position_id', position_id), ('image', image)) if value]
+        if not fields:
+            return
+        with self.transaction() as cursor:
+            self._execute(cursor, f"UPDATE candidates SET {', '.join(c + '=%s' for c, _ in fields)} WHERE id=%s",
+                          [v for _, v in fields] + [candidate_id])
+            self._bump_ballot_version(cursor)
+
+    def set_candidate_image(self, candidate_id, image):
+        with self.transaction() as cursor:
+            self._execute(cursor, 'UPDATE candidates SET image=%s WHERE id=%s', (image, candidate_id))
+            self._bump_ballot_version(cursor)
+
+    def delete_candidate(self, candidate_id):
+        with self.transaction() as cursor:
+            self._execute(cursor, 'DELETE FROM tallies WHERE candidate_id=%s', (candidate_id,))
+            self._execute(cursor, 'DELETE FROM candidates WHERE id=%s', (candidate_id,))
+            self._bump_ballot_version(cursor)
+
+    # Votes
+
+    def record_ballots(self, ballots):
+        rows, user_ids = collapse_ballots(ballots)
+        if not rows:
+            return
+        with self.transaction() as cursor:
+            self._lock_votes(cursor)
+            self._execute(cursor, *self._lock_voters_statement(user_ids))
+            cursor.fetchall()
+            self._execute(cursor, *self._existing_votes_statement(user_ids))
+            existing = {(u, p): c for u, p, c in cursor.fetchall()}
+            for sql, params in self._vote_write_statements(rows, user_ids, existing):
+                self._execute(cursor, sql, params)
+
+    def results(self):
+        with self.transaction() as cursor:
+            return self._query(cursor, RESULTS_QUERY)
+
+    def vote_counts(self):
+        with self.transaction() as cursor:
+            self._execute(cursor, 'SELECT position_id, candidate_id, COUNT(*) FROM votes GROUP BY position_id, candidate_id')
+            return {(p, c): n for p, c, n in cursor.fetchall()}
+
+    def iter_votes(self, chunk_size=10000):
+        # One short transaction per chunk, seeking by primary key
+        after = 0
+        while True:
+            with self.transaction() as cursor:
+                self._execute(cursor, 'SELECT id, user_id, position_id, candidate_id FROM votes '
+                                      'WHERE id > %s ORDER BY id LIMIT %s', (after, chunk_size))
+                rows = cursor.fetchall()
+            if not rows:
+                return
+            yield [(u, p, c) for _, u, p, c in rows]
+            after = rows[-1][0]
+
+    def tally_counts(self):
+        with self.transaction() as cursor:
+            self._execute(cursor, 'SELECT position_id, candidate_id, count FROM tallies')
+            return {(p, c): n for p, c, n in cursor.fetchall()}
+
+    def rebuild_tallies(self):
+        with self.transaction() as cursor:
+            self._lock_votes(cursor)
+            self._rebuild_tallies(cursor)
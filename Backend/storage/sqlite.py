@@ -0,0 +1,111 @@
+import sqlite3
+from contextlib import contextmanager
+
+from db_pool import ConnectionPool
+from storage.sql import SQLRepository
+
+# Tables as first created; later changes are in storage.migrations
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100),
+    email VARCHAR(100) UNIQUE,
+    password VARCHAR(100),
+    has_voted BOOLEAN DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS positions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100),
+    category VARCHAR(100)
+);
+CREATE TABLE IF NOT EXISTS candidates (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name VARCHAR(100),
+    image VARCHAR(255),
+    position_id INT REFERENCES positions(id)
+);
+CREATE TABLE IF NOT EXISTS votes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INT REFERENCES users(id),
+    position_id INT REFERENCES positions(id),
+    candidate_id INT REFERENCES candidates(id),
+    voted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (user_id, position_id)
+);
+"""
+
+
+class SQLiteConnection:
+    # The parts of the mysql.connector connection interface ConnectionPool relies on
+    unread_result = False
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('PRAGMA foreign_keys=ON')
+
+    def cursor(self):
+        return self._conn.cursor()
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def ping(self, reconnect=False):
+        self._conn.execute('SELECT 1')
+
+    def consume_results(self):
+        pass
+
+    def close(self):
+        self._conn.close()
+
+
+class SQLiteRepository(SQLRepository):
+    # Single-file backend for development, tests and benchmarks. SQLite serializes writers,
+    # so vote batches take the database write lock up front instead of row locks.
+    name = 'sqlite'
+    placeholder = '?'
+    insert_ignore = 'INSERT OR IGNORE'
+    cast_int = 'INTEGER'
+    like_escape = " ESCAPE '\\'"
+    for_update = ''
+    integrity_errors = (sqlite3.IntegrityError,)
+    base_schema = SCHEMA
+    timestamp_default = ''  # ALTER TABLE ADD COLUMN only takes constant defaults
+
+    def __init__(self, path, pool_size=10, pool_timeout=5.0, wrap_cursor=None):
+        self.path = path
+        super().__init__(ConnectionPool(lambda: SQLiteConnection(path), size=pool_size, timeout=pool_timeout,
+                                        wrap_cursor=wrap_cursor))
+
+    def _upsert_clause(self, key, updates):
+        return f" ON CONFLICT ({', '.join(key)}) DO UPDATE SET " + ', '.join(
+            f"{column}={expression.format(new=f'excluded.{column}')}" for column, expression in updates.items())
+
+    def _lock_votes(self, cursor):
+        if not cursor.connection.in_transaction:
+            self._execute(cursor, 'BEGIN IMMEDIATE')
+
+    @contextmanager
+    def _migration_lock(self, cursor):
+        # SQLite DDL is transactional: holding the write lock makes the whole run atomic
+        self._lock_votes(cursor)
+        yield
+
+    def _has_column(self, cursor, table, column):
+        self._execute(cursor, f'PRAGMA table_info({table})')
+        return any(row[1] == column for row in cursor.fetchall())
+
+    def _ensure_index(self, cursor, table, name, columns):
+        self._execute(cursor, f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})')
+
+    def _widen_column(self, cursor, table, column, definition):
+        pass  # SQLite does not enforce VARCHAR lengths
@@ -0,0 +1,24 @@
+from collections import Counter
+
+
+def vote_deltas(existing, new_rows):
+    # existing/new_rows: {(user_id, position_id): candidate_id}
+    deltas = Counter()
+    for key, candidate_id in new_rows.items():
+        old = existing.get(key)
+        if old == candidate_id:
+            continue
+        position_id = key[1]
+        deltas[(position_id, candidate_id)] += 1
+        if old is not None:
+            deltas[(position_id, old)] -= 1
+    return deltas
+
+
+def diff_tallies(actual, stored):
+    # Returns [(position_id, candidate_id, tally_count, actual_count)] where they disagree
+    drift = []
+    for key in sorted(set(actual) | set(stored)):
+        if actual.get(key, 0) != stored.get(key, 0):
+            drift.append((key[0], key[1], stored.get(key, 0), actual.get(key, 0)))
+    return drift
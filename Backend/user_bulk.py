@@ -0,0 +1,129 @@
+import csv
+import io
+import json
+import time
+
+EXPORT_COLUMNS = ('id', 'name', 'email', 'has_voted')
+MAX_REPORTED_ERRORS = 1000
+
+
+def detect_format(filename, default='csv'):
+    if filename and filename.lower().endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    if filename and filename.lower().endswith('.csv'):
+        return 'csv'
+    return default
+
+
+def iter_records(stream, fmt):
+    # Yields (line_no, record_dict or None, error or None) from a binary stream, one row at a time
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for record in reader:
+            yield reader.line_num, record, None
+    elif fmt == 'ndjson':
+        for line_no, line in enumerate(text, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_no, None, f'Invalid JSON: {e}'
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, 'Expected a JSON object.'
+                continue
+            yield line_no, record, None
+    else:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+
+def _user_row(record):
+    # NDJSON values can be any JSON type, not just strings
+    email = record.get('email') or ''
+    name = record.get('name') or ''
+    password = record.get('password')
+    if not isinstance(email, str) or not isinstance(name, str):
+        raise ValueError('email and name must be strings.')
+    email = email.strip()
+    if not email or '@' not in email:
+        raise ValueError('A valid email is required.')
+    if not password:
+        raise ValueError('Password is required.')
+    if not isinstance(password, str):
+        raise ValueError('password must be a string.')
+    return name.strip() or email.split('@')[0], email, password
+
+
+def import_users(repo, records, mode='ignore', chunk_size=1000, on_progress=None, hash_passwords=None):
+    # mode 'ignore' keeps existing users untouched (INSERT IGNORE); 'upsert' updates name/password.
+    # hash_passwords maps a list of plaintext passwords to their stored form.
+    if mode not in ('ignore', 'upsert'):
+        raise ValueError(f'Unsupported mode: {mode}')
+    report = {'processed': 0, 'inserted': 0, 'upserted': 0, 'skipped': 0, 'failed': 0, 'errors': []}
+    started = time.monotonic()
+    chunk = []
+
+    def flush():
+        if not chunk:
+            return
+        if hash_passwords is not None:
+            hashes = hash_passwords([password for _, _, password in chunk])
+            chunk[:] = [(name, email, hashed) for (name, email, _), hashed in zip(chunk, hashes)]
+        affected = repo.insert_users(chunk, mode)
+        if mode == 'ignore':
+            report['inserted'] += affected
+            report['skipped'] += len(chunk) - affected
+        else:
+            # rowcount can't tell inserts from updates from unchanged rows here
+            report['upserted'] += len(chunk)
+        chunk.clear()
+        if on_progress:
+            on_progress(_with_throughput(report, started))
+
+    for line_no, record, error in records:
+        report['processed'] += 1
+        if error is None:
+            try:
+                chunk.append(_user_row(record))
+            except ValueError as e:
+                error = str(e)
+        if error is not None:
+            report['failed'] += 1
+            if len(report['errors']) < MAX_REPORTED_ERRORS:
+                report['errors'].append({'line': line_no, 'message': error})
+        if len(chunk) >= chunk_size:
+            flush()
+    flush()
+    return _with_throughput(report, started)
+
+
+def _with_throughput(report, started):
+    elapsed = time.monotonic() - started
+    report['elapsed_seconds'] = round(elapsed, 3)
+    report['rows_per_second'] = round(report['processed'] / elapsed, 1) if elapsed > 0 else None
+    return report
+
+
+def export_users(repo, fmt='csv', chunk_size=1000):
+    # Yields the users table in id order, one keyset-paginated chunk at a time
+    if fmt not in ('csv', 'ndjson'):
+        raise ValueError(f'Unsupported format: {fmt}')
+    if fmt == 'csv':
+        yield ','.join(EXPORT_COLUMNS) + '\r\n'
+    last_id = 0
+    while True:
+        rows, _ = repo.list_users(EXPORT_COLUMNS, after=last_id, limit=chunk_size)
+        if not rows:
+            return
+        buf = io.StringIO()
+        if fmt == 'csv':
+            writer = csv.writer(buf)
+            for row in rows:
+                writer.writerow([row[c] for c in EXPORT_COLUMNS])
+        else:
+            for row in rows:
+                buf.write(json.dumps({c: row[c] for c in EXPORT_COLUMNS}) + '\n')
+        yield buf.getvalue()
+        last_id = rows[-1]['id']
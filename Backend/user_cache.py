@@ -0,0 +1,62 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    # Bounded LRU of email -> user row with a short TTL, so repeat logins skip the users
+    # lookup. Callers invalidate on writes to a user; the TTL bounds how long a row
+    # changed by another process can be served.
+    def __init__(self, maxsize=10000, ttl=30.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._rows = OrderedDict()  # email -> (row, expires)
+        self._emails = {}  # user id -> email
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, email):
+        with self._lock:
+            entry = self._rows.get(email)
+            if entry is not None and entry[1] > self._clock():
+                self._rows.move_to_end(email)
+                self.hits += 1
+                return dict(entry[0])
+            if entry is not None:
+                self._discard(email)
+            self.misses += 1
+            return None
+
+    def put(self, row):
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._discard(row['email'])
+            self._rows[row['email']] = (dict(row), self._clock() + self.ttl)
+            self._emails[row['id']] = row['email']
+            while len(self._rows) > self.maxsize:
+                self._discard(next(iter(self._rows)))
+
+    def invalidate(self, email=None, user_id=None):
+        with self._lock:
+            if user_id is not None:
+                email = self._emails.get(user_id, email)
+            if email is not None:
+                self._discard(email)
+
+    def clear(self):
+        with self._lock:
+            self._rows.clear()
+            self._emails.clear()
+
+    def _discard(self, email):
+        entry = self._rows.pop(email, None)
+        if entry is not None and self._emails.get(entry[0]['id']) == email:
+            del self._emails[entry[0]['id']]
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._rows), 'maxsize': self.maxsize, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,171 @@
+"""Offline recount from the append-only vote log (see vote_log.py).
+
+The log is memory-mapped and split into chunks of records. A process pool verifies each
+chunk's hash chain and reduces it to the last vote per (user_id, position_id); the parent
+merges the chunks in log order, tallies them with NumPy and compares the recount with the
+votes table and the published results. Run it against a quiesced election: votes written
+during the audit show up as discrepancies.
+
+    cd Backend
+    flask audit-votes --workers 4
+    flask audit-votes --results-url https://example.org/api/results
+"""
+import hashlib
+import mmap
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from tallies import diff_tallies
+from vote_log import HEADER_SIZE, PAYLOAD_SIZE, RECORD_SIZE, genesis_chain
+
+RECORD_DTYPE = np.dtype([('seq', '<u8'), ('voted_at', '<f8'), ('user_id', '<u4'), ('position_id', '<u4'),
+                         ('candidate_id', '<u4'), ('pad', 'V4'), ('chain', 'V32')])
+assert RECORD_DTYPE.itemsize == RECORD_SIZE
+MAX_REPORTED = 20  # per kind of problem; the counts are always complete
+
+
+def vote_keys(user_ids, position_ids):
+    # One uint64 per (user, position), the same packing the in-memory backend uses
+    return (user_ids.astype(np.uint64) << np.uint64(32)) | position_ids.astype(np.uint64)
+
+
+def last_writes(keys):
+    # Sorted distinct keys and the index of each one's last occurrence
+    distinct, first_from_end = np.unique(keys[::-1], return_index=True)
+    return distinct, len(keys) - 1 - first_from_end
+
+
+def _verify_chain(mm, start, count):
+    # Returns (seqs of records whose chain does not match, chain of the last record).
+    # Verification continues from each stored value, so one bad record is reported once.
+    offset = HEADER_SIZE + start * RECORD_SIZE
+    prev = genesis_chain(mm[:HEADER_SIZE]) if start == 0 else mm[offset - 32:offset]
+    broken = []
+    sha256 = hashlib.sha256
+    for at in range(offset, offset + count * RECORD_SIZE, RECORD_SIZE):
+        record = mm[at:at + RECORD_SIZE]
+        chain = record[PAYLOAD_SIZE:]
+        if sha256(prev + record[:PAYLOAD_SIZE]).digest() != chain:
+            broken.append(start + (at - offset) // RECORD_SIZE + 1)
+        prev = chain
+    return broken, prev
+
+
+def scan_chunk(task):
+    # Runs in a pool worker: verify one chunk and reduce it to its last write per key
+    path, start, count = task
+    started = time.perf_counter()
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        broken, head = _verify_chain(mm, start, count)
+        records = np.frombuffer(mm, RECORD_DTYPE, count, HEADER_SIZE + start * RECORD_SIZE)
+        expected = np.arange(start + 1, start + count + 1, dtype=np.uint64)
+        out_of_sequence = (start + 1 + np.flatnonzero(records['seq'] != expected)).tolist()
+        keys, last = last_writes(vote_keys(records['user_id'], records['position_id']))
+        candidates = records['candidate_id'][last]  # fancy indexing copies out of the mapping
+        del records  # the mapping cannot close while an array still points into it
+    return {
+        'start': start,
+        'count': count,
+        'keys': keys,
+        'candidates': candidates,
+        'broken': broken,
+        'out_of_sequence': out_of_sequence,
+        'head': head,
+        'seconds': time.perf_counter() - started,
+    }
+
+
+def plan_chunks(path, chunk_records):
+    # Returns (tasks, trailing bytes that do not form a whole record)
+    with open(path, 'rb') as f:
+        genesis_chain(f.read(HEADER_SIZE))
+        size = os.fstat(f.fileno()).st_size
+    total, torn = divmod(size - HEADER_SIZE, RECORD_SIZE)
+    return [(path, start, min(chunk_records, total - start)) for start in range(0, total, chunk_records)], torn
+
+
+def replay_log(path, workers=None, chunk_records=1 << 20):
+    started = time.perf_counter()
+    tasks, torn = plan_chunks(path, chunk_records)
+    if workers == 1 or len(tasks) <= 1:
+        chunks = [scan_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = list(pool.map(scan_chunk, tasks))
+    # Chunks come back in log order, so a later chunk's vote for a key wins
+    if chunks:
+        keys, last = last_writes(np.concatenate([c['keys'] for c in chunks]))
+        candidates = np.concatenate([c['candidates'] for c in chunks])[last]
+    else:
+        keys, candidates = np.empty(0, np.uint64), np.empty(0, np.uint32)
+    records = sum(c['count'] for c in chunks)
+    elapsed = time.perf_counter() - started
+    return {
+        'path': path,
+        'records': records,
+        'bytes': HEADER_SIZE + records * RECORD_SIZE + torn,
+        'torn_bytes': torn,
+        'chunks': len(chunks),
+        'keys': keys,
+        'candidates': candidates,
+        'broken': [seq for c in chunks for seq in c['broken']],
+        'out_of_sequence': [seq for c in chunks for seq in c['out_of_sequence']],
+        'head': chunks[-1]['head'].hex() if chunks else None,
+        'worker_seconds': sum(c['seconds'] for c in chunks),
+        'elapsed_seconds': elapsed,
+    }
+
+
+def tally(keys, candidates):
+    # {(position_id, candidate_id): votes} from the replayed last writes
+    positions = keys & np.uint64(0xFFFFFFFF)
+    pairs, counts = np.unique((positions << np.uint64(32)) | candidates.astype(np.uint64), return_counts=True)
+    return {(int(pair >> 32), int(pair & 0xFFFFFFFF)): int(n) for pair, n in zip(pairs.tolist(), counts.tolist())}
+
+
+def load_votes(vote_chunks):
+    # Sorted keys and candidate ids of the votes table, from repo.iter_votes()
+    arrays = [np.asarray(chunk, dtype=np.int64).reshape(-1, 3) for chunk in vote_chunks]
+    rows = np.concatenate(arrays) if arrays else np.empty((0, 3), np.int64)
+    keys = vote_keys(rows[:, 0], rows[:, 1])
+    order = np.argsort(keys, kind='stable')
+    return keys[order], rows[order, 2].astype(np.uint32)
+
+
+def compare_votes(log_keys, log_candidates, table_keys, table_candidates):
+    # [(user_id, position_id, log candidate, table candidate)]; None where a side has no vote
+    def split(keys):
+        return [(int(k >> 32), int(k & 0xFFFFFFFF)) for k in keys.tolist()]
+    common, in_log, in_table = np.intersect1d(log_keys, table_keys, assume_unique=True, return_indices=True)
+    changed = np.flatnonzero(log_candidates[in_log] != table_candidates[in_table])
+    discrepancies = [(u, p, int(log_candidates[in_log[i]]), int(table_candidates[in_table[i]]))
+                     for (u, p), i in zip(split(common[changed]), changed.tolist())]
+    only_log = np.isin(log_keys, common, assume_unique=True, invert=True)
+    discrepancies += [(u, p, int(c), None)
+                      for (u, p), c in zip(split(log_keys[only_log]), log_candidates[only_log].tolist())]
+    only_table = np.isin(table_keys, common, assume_unique=True, invert=True)
+    discrepancies += [(u, p, None, int(c))
+                      for (u, p), c in zip(split(table_keys[only_table]), table_candidates[only_table].tolist())]
+    return sorted(discrepancies)
+
+
+def published_counts(results):
+    # {(position_id, candidate_id): votes} from the /api/results rows, zero rows dropped
+    return {(row['position_id'], row['candidate_id']): row['votes'] for row in results if row['votes']}
+
+
+def audit(path, vote_chunks, results, workers=None, chunk_records=1 << 20):
+    report = replay_log(path, workers=workers, chunk_records=chunk_records)
+    compared = time.perf_counter()
+    table_keys, table_candidates = load_votes(vote_chunks)
+    report['tally'] = tally(report['keys'], report['candidates'])
+    report['vote_discrepancies'] = compare_votes(report['keys'], report['candidates'], table_keys, table_candidates)
+    # [(position_id, candidate_id, published, recounted)]
+    report['result_discrepancies'] = diff_tallies(report['tally'], published_counts(results))
+    report['table_votes'] = len(table_keys)
+    report['compare_seconds'] = time.perf_counter() - compared
+    return report
+
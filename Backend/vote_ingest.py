@@ -0,0 +1,228 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from storage import IntegrityViolation
+
+logger = logging.getLogger(__name__)
+
+
+class IngestQueueFull(Exception):
+    pass
+
+
+class InvalidBallot(Exception):
+    pass
+
+
+def normalize_ballot(user_id, votes):
+    # Returns (user_id, {position_id: candidate_id}) with int keys, or raises InvalidBallot
+    if not isinstance(votes, dict) or not votes:
+        raise InvalidBallot('No votes submitted.')
+    try:
+        user_id = int(user_id)
+        votes = {int(p): int(c) for p, c in votes.items()}
+    except (TypeError, ValueError):
+        raise InvalidBallot('Invalid ballot format.')
+    return user_id, votes
+
+
+class VoteIngestor:
+    # Accepts ballots into an fsync'd append-only journal and drains them into storage
+    # from a background thread, one record_ballots() transaction per batch.
+    def __init__(self, record_ballots, journal_dir, max_queue=10000, batch_size=500,
+                 flush_interval=0.05, fsync=True):
+        self._record_ballots = record_ballots
+        self.journal_dir = journal_dir
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._queue = deque()
+        self._pending_since = 0.0  # when the oldest queued ballot arrived; replayed ones are overdue
+        self._cond = threading.Condition()
+        self._sync_lock = threading.Lock()
+        self._journal = None
+        self._thread = None
+        self._stopping = False
+        self._next_seq = 1
+        self._written_seq = 0
+        self._synced_seq = 0
+        self._committed_seq = 0
+        self.accepted = 0
+        self.written = 0
+        self.batches = 0
+        self.rejected = 0
+        self.failed = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        os.makedirs(self.journal_dir, exist_ok=True)
+        self._journal = self._claim_journal()
+        self._replay()
+        self._thread = threading.Thread(target=self._run, name='vote-ingest-writer', daemon=True)
+        self._thread.start()
+
+    def _claim_journal(self):
+        # Each worker process owns one journal slot; a restarted worker picks up a dead one's slot
+        slot = 0
+        while True:
+            path = os.path.join(self.journal_dir, 'votes-%d.journal' % slot)
+            f = open(path, 'a+')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                slot += 1
+                continue
+            self._journal_path = path
+            self._checkpoint_path = path + '.ckpt'
+            return f
+
+    def _replay(self):
+        committed = 0
+        if os.path.exists(self._checkpoint_path):
+            with open(self._checkpoint_path) as f:
+                committed = int(f.read().strip() or 0)
+        pending = []
+        self._journal.seek(0)
+        good_end = 0
+        while True:
+            line = self._journal.readline()
+            if not line:
+                break
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            good_end = self._journal.tell()
+            if entry['seq'] > committed:
+                pending.append(entry)
+        # Drop a torn write at the tail left by a crash so new entries start on a clean line
+        self._journal.truncate(good_end)
+        last_seq = max([committed] + [e['seq'] for e in pending])
+        self._next_seq = last_seq + 1
+        self._written_seq = self._synced_seq = last_seq
+        self._committed_seq = committed
+        if not pending:
+            self._journal.truncate(0)
+        for entry in pending:
+            votes = {int(p): int(c) for p, c in entry['votes'].items()}
+            self._queue.append((entry['seq'], entry['user_id'], votes))
+        if pending:
+            logger.info('Replaying %d journaled ballots from %s', len(pending), self._journal_path)
+
+    def submit(self, user_id, votes):
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise IngestQueueFull('Vote queue is full')
+            seq = self._next_seq
+            self._next_seq += 1
+            self._journal.write(json.dumps({'seq': seq, 'user_id': user_id, 'votes': votes}) + '\n')
+            self._journal.flush()
+            self._written_seq = seq
+            if not self._queue:
+                self._pending_since = time.monotonic()
+            self._queue.append((seq, user_id, votes))
+            self.accepted += 1
+            # Wake the writer to start a flush_interval window, or when a full batch is ready
+            if len(self._queue) == 1 or len(self._queue) == self.batch_size:
+                self._cond.notify()
+        if self.fsync:
+            self._sync(seq)
+
+    def _sync(self, seq):
+        # Group fsync: one caller syncs everything written so far on behalf of the others
+        with self._sync_lock:
+            if self._synced_seq >= seq:
+                return
+            target = self._written_seq
+            os.fsync(self._journal.fileno())
+            self._synced_seq = target
+
+    def _run(self):
+        # A batch is drained once batch_size ballots are queued or the oldest one has waited
+        # flush_interval, so ballots arriving close together share one storage transaction
+        while True:
+            with self._cond:
+                while len(self._queue) < self.batch_size and not self._stopping:
+                    if not self._queue:
+                        self._cond.wait()
+                        continue
+                    remaining = self._pending_since + self.flush_interval - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if not self._queue:
+                    return  # stopping, and everything is written
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            self._write(batch)
+
+    def _write(self, batch):
+        delay = 0.1
+        while True:
+            try:
+                self._write_batch(batch)
+                break
+            except Exception as e:
+                if len(batch) > 1 and _is_data_error(e):
+                    # Isolate the bad ballot(s) so one invalid row can't stall the queue
+                    for entry in batch:
+                        self._write([entry])
+                    return
+                if _is_data_error(e):
+                    self.failed += 1
+                    logger.error('Dropping invalid journaled ballot seq=%s: %s', batch[0][0], e)
+                    break
+                logger.warning('Vote writer error, retrying in %.1fs: %s', delay, e)
+                time.sleep(delay)
+                delay = min(delay * 2, 5.0)
+        self._checkpoint(batch[-1][0])
+
+    def _write_batch(self, batch):
+        self._record_ballots([(user_id, votes) for _, user_id, votes in batch])
+        self.written += len(batch)
+        self.batches += 1
+
+    def _checkpoint(self, seq):
+        tmp = self._checkpoint_path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(str(seq))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._checkpoint_path)
+        with self._cond:
+            self._committed_seq = seq
+            # Journal fully drained: start it over so it doesn't grow without bound
+            if not self._queue and self._written_seq == seq:
+                self._journal.truncate(0)
+
+    def stop(self, timeout=10.0):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'queued': len(self._queue),
+                'max_queue': self.max_queue,
+                'accepted': self.accepted,
+                'written': self.written,
+                'batches': self.batches,
+                'rejected': self.rejected,
+                'failed': self.failed,
+            }
+
+
+def _is_data_error(e):
+    # Retrying rows that reference missing users/candidates will never succeed
+    return isinstance(e, IntegrityViolation)
@@ -0,0 +1,137 @@
+import fcntl
+import hashlib
+import logging
+import os
+import secrets
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('voting.vote_log')
+
+MAGIC = b'VOTELOG1'
+HEADER = struct.Struct('<8s24sd24x')  # magic, random nonce, created_at
+HEADER_SIZE = HEADER.size
+# seq, voted_at, user_id, position_id, candidate_id; then the 32-byte chain hash
+PAYLOAD = struct.Struct('<QdIII4x')
+PAYLOAD_SIZE = PAYLOAD.size
+RECORD_SIZE = PAYLOAD_SIZE + 32
+
+
+class InvalidLog(Exception):
+    pass
+
+
+def genesis_chain(header):
+    # The chain value the first record links to; the nonce makes every log's chain distinct
+    if len(header) != HEADER_SIZE or header[:len(MAGIC)] != MAGIC:
+        raise InvalidLog('Not a vote log (bad header).')
+    return hashlib.sha256(header).digest()
+
+
+def link(prev_chain, payload):
+    return hashlib.sha256(prev_chain + payload).digest()
+
+
+class VoteLog:
+    # Append-only, hash-chained record of every committed vote: one 64-byte record per
+    # (user_id, position_id, candidate_id). A record's chain field is
+    # sha256(previous chain + its first 32 bytes), so editing, dropping or reordering any
+    # record breaks every later link. Appends hold an exclusive flock on the file, so all
+    # worker processes on the host can share one log; fsync is grouped like the ingest
+    # journal's, one call covering every append made while the previous one ran.
+    def __init__(self, path, fsync=True):
+        self.path = path
+        self.fsync = fsync
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o640)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._written = 0
+        self._synced = 0
+        self.appends = 0
+        self.records = 0
+        self.syncs = 0
+        with self._locked():
+            self._genesis = self._open_header()
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _open_header(self):
+        if os.fstat(self._fd).st_size < HEADER_SIZE:
+            # New file, or a crash while creating one: nothing has been logged yet
+            os.ftruncate(self._fd, 0)
+            os.write(self._fd, HEADER.pack(MAGIC, secrets.token_bytes(24), time.time()))
+            os.fsync(self._fd)
+        return genesis_chain(os.pread(self._fd, HEADER_SIZE, 0))
+
+    def _tail(self):
+        # (seq, chain) of the last complete record; called with the file lock held
+        size = os.fstat(self._fd).st_size
+        torn = (size - HEADER_SIZE) % RECORD_SIZE
+        if torn:
+            # A crash mid-append left a partial record; its ballot was never acknowledged
+            logger.warning('Truncating %d byte(s) of a torn record from %s', torn, self.path)
+            size -= torn
+            os.ftruncate(self._fd, size)
+        if size == HEADER_SIZE:
+            return 0, self._genesis
+        record = os.pread(self._fd, RECORD_SIZE, size - RECORD_SIZE)
+        return PAYLOAD.unpack(record[:PAYLOAD_SIZE])[0], record[PAYLOAD_SIZE:]
+
+    def append(self, ballots):
+        # ballots: [(user_id, {position_id: candidate_id})] as just committed to storage
+        voted_at = time.time()
+        votes = [(user_id, position_id, candidate_id)
+                 for user_id, ballot in ballots for position_id, candidate_id in ballot.items()]
+        if not votes:
+            return
+        with self._locked():
+            seq, chain = self._tail()
+            buf = bytearray()
+            for user_id, position_id, candidate_id in votes:
+                seq += 1
+                payload = PAYLOAD.pack(seq, voted_at, user_id, position_id, candidate_id)
+                chain = link(chain, payload)
+                buf += payload
+                buf += chain
+            view = memoryview(buf)
+            while view:
+                view = view[os.write(self._fd, view):]
+            self._written += 1
+            ticket = self._written
+            self.appends += 1
+            self.records += len(votes)
+        if self.fsync:
+            self._sync(ticket)
+
+    def _sync(self, ticket):
+        with self._sync_lock:
+            if self._synced >= ticket:
+                return
+            with self._lock:
+                target = self._written
+            os.fsync(self._fd)
+            self._synced = target
+            self.syncs += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'path': self.path,
+                'bytes': os.fstat(self._fd).st_size,
+                'appends': self.appends,
+                'records': self.records,
+                'fsyncs': self.syncs,
+            }
+
+    def close(self):
+        os.close(self._fd)
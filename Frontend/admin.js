@@ -46,6 +46,10 @@ function showTab(tab) {
 }
 
 function adminLogout() {
+    if (adminResultsSource) {
+        adminResultsSource.close();
+        adminResultsSource = null;
+    }
     adminDashboard.style.display = 'none';
     adminLoginSection.style.display = 'block';
 }
@@ -66,27 +70,44 @@ adminLoginForm.addEventListener('submit', function(e) {
     }
 });
 
-// Render users (refactored to fetch from backend)
+// Render users one keyset page at a time, plus a turnout summary
+let usersNextCursor = null;
+
 async function renderAdminUsers() {
     const usersList = document.getElementById('admin-users-list');
     usersList.innerHTML = '<p>Loading...</p>';
+    usersNextCursor = null;
     try {
-        const response = await fetch('https://voting-system-backend-xdpf.onrender.com/api/users');
-        const data = await response.json();
-        const users = data.users || [];
-        if (users.length === 0) {
-            usersList.innerHTML = '<p>No users found.</p>';
-            return;
-        }
-        usersList.innerHTML = '<ul>' + users.map(u => `
-            <li>${u.email} (${u.has_voted ? 'Voted' : 'Not Voted'})
-                <button onclick="deleteUser(${u.id})" style="margin-left:1rem;color:#fff;background:#e74c3c;border:none;border-radius:5px;padding:2px 8px;cursor:pointer;">Delete</button>
-            </li>`).join('') + '</ul>';
+        const summaryRes = await fetch('https://voting-system-backend-xdpf.onrender.com/api/users/summary');
+        const summary = await summaryRes.json();
+        usersList.innerHTML = `<p>${summary.voted} of ${summary.total} voters have voted (${(summary.turnout * 100).toFixed(1)}%)</p><ul id="admin-users-ul"></ul><div id="admin-users-more"></div>`;
+        await loadMoreAdminUsers();
     } catch (err) {
         usersList.innerHTML = '<p>Error loading users.</p>';
     }
 }
 
+async function loadMoreAdminUsers() {
+    const after = usersNextCursor ? `&after=${usersNextCursor}` : '';
+    const response = await fetch(`https://voting-system-backend-xdpf.onrender.com/api/users?fields=id,email,has_voted&limit=100${after}`);
+    const data = await response.json();
+    const users = data.users || [];
+    const usersUl = document.getElementById('admin-users-ul');
+    if (users.length === 0 && !usersNextCursor) {
+        usersUl.outerHTML = '<p>No users found.</p>';
+        return;
+    }
+    usersUl.innerHTML += users.map(u => `
+        <li>${u.email} (${u.has_voted ? 'Voted' : 'Not Voted'})
+            <button onclick="deleteUser(${u.id})" style="margin-left:1rem;color:#fff;background:#e74c3c;border:none;border-radius:5px;padding:2px 8px;cursor:pointer;">Delete</button>
+        </li>`).join('');
+    usersNextCursor = data.next_cursor;
+    document.getElementById('admin-users-more').innerHTML = usersNextCursor
+        ? '<button onclick="loadMoreAdminUsers()">Load more</button>'
+        : '';
+}
+window.loadMoreAdminUsers = loadMoreAdminUsers;
+
 // Delete user logic (refactored to use backend API)
 window.deleteUser = async function(userId) {
     if (!confirm('Are you sure you want to delete this user?')) return;
@@ -279,12 +300,31 @@ window.addCandidate = async function(positionId) {
     return false;
 };
 
-// Render results from backend
-async function renderAdminResults() {
+// Live results: one EventSource per dashboard, kept up to date from snapshot/diff events
+let adminResults = {};
+let adminResultsSource = null;
+
+function renderAdminResults() {
+    if (!adminResultsSource) {
+        adminResultsSource = new EventSource('https://voting-system-backend-xdpf.onrender.com/api/results/stream');
+        adminResultsSource.addEventListener('snapshot', e => {
+            adminResults = {};
+            JSON.parse(e.data).results.forEach(r => { adminResults[`${r.position_id}-${r.candidate_id}`] = r; });
+            drawAdminResults();
+        });
+        adminResultsSource.addEventListener('diff', e => {
+            const diff = JSON.parse(e.data);
+            diff.changed.forEach(r => { adminResults[`${r.position_id}-${r.candidate_id}`] = r; });
+            diff.removed.forEach(([positionId, candidateId]) => { delete adminResults[`${positionId}-${candidateId}`]; });
+            drawAdminResults();
+        });
+    }
+    drawAdminResults();
+}
+
+function drawAdminResults() {
     const resultsList = document.getElementById('admin-results-list');
-    const res = await fetch('https://voting-system-backend-xdpf.onrender.com/api/results');
-    const data = await res.json();
-    const results = data.results || [];
+    const results = Object.values(adminResults);
     if (results.length === 0) {
         resultsList.innerHTML = '<p>No results found.</p>';
         return;
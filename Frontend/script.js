@@ -48,8 +48,9 @@ function showSection(section) {
     section.style.display = 'block';
 }
 
-// Store the current user in a JS variable for the session
+// Store the current user and their session token in JS variables for the session
 let currentUser = null;
+let sessionToken = null;
 
 // Login logic (refactored to use backend API)
 loginForm.addEventListener('submit', async function(e) {
@@ -68,6 +69,7 @@ loginForm.addEventListener('submit', async function(e) {
             return;
         }
         currentUser = data.user;
+        sessionToken = data.token;
         await showVotingPage(); // Wait for positions to be fetched
     } catch (err) {
         alert('Error connecting to server.');
@@ -77,12 +79,18 @@ loginForm.addEventListener('submit', async function(e) {
 // Logout
 logoutBtn.addEventListener('click', function() {
     currentUser = null;
+    sessionToken = null;
     showSection(loginSection);
 });
 
 // Back to login from results
 backToLogin.addEventListener('click', function() {
     currentUser = null;
+    sessionToken = null;
+    if (resultsSource) {
+        resultsSource.close();
+        resultsSource = null;
+    }
     showSection(loginSection);
 });
 
@@ -164,7 +172,7 @@ votingForm.addEventListener('submit', async function(e) {
     try {
         const response = await fetch('https://voting-system-backend-xdpf.onrender.com/api/vote', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${sessionToken}` },
             body: JSON.stringify({ user_id: currentUser.id, votes: votesById })
         });
         const data = await response.json();
@@ -183,51 +191,71 @@ votingForm.addEventListener('submit', async function(e) {
     }
 });
 
-// Refactored: Show results by fetching from backend
-async function showResultsPage() {
-    try {
-        const response = await fetch('https://voting-system-backend-xdpf.onrender.com/api/results');
-        const data = await response.json();
-        if (!Array.isArray(data)) {
-            resultsContainer.innerHTML = '<em>No results available.</em>';
-            showSection(resultsSection);
-            return;
-        }
-        resultsContainer.innerHTML = '';
-        // Group results by position
-        const grouped = {};
-        data.forEach(row => {
-            if (!grouped[row.position_id]) {
-                grouped[row.position_id] = {
-                    position_name: row.position_name,
-                    candidates: []
-                };
-            }
-            grouped[row.position_id].candidates.push({
-                candidate_name: row.candidate_name,
-                votes: row.votes
-            });
+// Live results pushed from the backend over Server-Sent Events
+let liveResults = {};
+let resultsSource = null;
+
+function showResultsPage() {
+    if (!resultsSource) {
+        resultsSource = new EventSource('https://voting-system-backend-xdpf.onrender.com/api/results/stream');
+        resultsSource.addEventListener('snapshot', e => {
+            liveResults = {};
+            JSON.parse(e.data).results.forEach(row => { liveResults[`${row.position_id}-${row.candidate_id}`] = row; });
+            renderResults();
         });
-        Object.values(grouped).forEach(pos => {
-            const posDiv = document.createElement('div');
-            posDiv.innerHTML = `<strong>${pos.position_name}</strong><br>`;
-            let maxVotes = 0;
-            let winner = '';
-            pos.candidates.forEach(candidate => {
-                posDiv.innerHTML += `${candidate.candidate_name}: ${candidate.votes} votes<br>`;
-                if (candidate.votes > maxVotes) {
-                    maxVotes = candidate.votes;
-                    winner = candidate.candidate_name;
-                }
-            });
-            posDiv.innerHTML += `<em>Winner: ${winner || 'No votes yet'}</em><br><br>`;
-            resultsContainer.appendChild(posDiv);
+        resultsSource.addEventListener('diff', e => {
+            const diff = JSON.parse(e.data);
+            diff.changed.forEach(row => { liveResults[`${row.position_id}-${row.candidate_id}`] = row; });
+            diff.removed.forEach(([positionId, candidateId]) => { delete liveResults[`${positionId}-${candidateId}`]; });
+            renderResults();
         });
-        showSection(resultsSection);
-    } catch (err) {
-        resultsContainer.innerHTML = '<em>Error fetching results from server.</em>';
-        showSection(resultsSection);
+        resultsSource.onerror = () => {
+            // EventSource reconnects on its own (resuming via Last-Event-ID)
+            if (Object.keys(liveResults).length === 0) {
+                resultsContainer.innerHTML = '<em>Error fetching results from server.</em>';
+            }
+        };
+    }
+    renderResults();
+    showSection(resultsSection);
+}
+
+function renderResults() {
+    const data = Object.values(liveResults);
+    if (data.length === 0) {
+        resultsContainer.innerHTML = '<em>No results available.</em>';
+        return;
     }
+    resultsContainer.innerHTML = '';
+    // Group results by position
+    const grouped = {};
+    data.forEach(row => {
+        if (!grouped[row.position_id]) {
+            grouped[row.position_id] = {
+                position_name: row.position_name,
+                candidates: []
+            };
+        }
+        grouped[row.position_id].candidates.push({
+            candidate_name: row.candidate_name,
+            votes: row.votes
+        });
+    });
+    Object.values(grouped).forEach(pos => {
+        const posDiv = document.createElement('div');
+        posDiv.innerHTML = `<strong>${pos.position_name}</strong><br>`;
+        let maxVotes = 0;
+        let winner = '';
+        pos.candidates.forEach(candidate => {
+            posDiv.innerHTML += `${candidate.candidate_name}: ${candidate.votes} votes<br>`;
+            if (candidate.votes > maxVotes) {
+                maxVotes = candidate.votes;
+                winner = candidate.candidate_name;
+            }
+        });
+        posDiv.innerHTML += `<em>Winner: ${winner || 'No votes yet'}</em><br><br>`;
+        resultsContainer.appendChild(posDiv);
+    });
 }
 
 // On page load, show login or voting if already logged in (session only)